@@ -0,0 +1,70 @@
+"""
+Compares HanziConv.toSimplified, called once per line the way the code used to, with the conversion module's
+memoized to_simplified and its bulk_to_simplified on a 100,000 line word list. The list is built from the characters
+HanziConv knows about with words repeating the way they do across decks. Every method must give identical results.
+
+    python benchmarks/bench_conversion.py --lines 100000
+"""
+
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from hanziconv import HanziConv  # noqa: E402
+from hanziconv.charmap import traditional_charmap  # noqa: E402
+
+import conversion  # noqa: E402
+
+
+def word_list(lines, distinct, seed=0):
+    """
+    :param int lines: The number of lines
+    :param int distinct: The number of distinct words the lines are drawn from
+    :return: Returns a list of one to four character traditional words
+    :rtype: list
+    """
+    generator = random.Random(seed)
+    words = ["".join(generator.choice(traditional_charmap) for _ in range(generator.randint(1, 4)))
+             for _ in range(distinct)]
+    return [generator.choice(words) for _ in range(lines)]
+
+
+def timed(label, function, words):
+    started = time.perf_counter()
+    result = function(words)
+    elapsed = time.perf_counter() - started
+    print("%-36s %8.1f ms %8.2f us per line" % (label, elapsed * 1000, elapsed * 1000000 / len(words)))
+    return result
+
+
+def main():
+    parser = ArgumentParser(description="Benchmarks traditional to simplified conversion")
+    parser.add_argument('--lines', dest="lines", type=int, default=100000, help='The number of lines to convert')
+    parser.add_argument('--distinct', dest="distinct", type=int, default=20000,
+                        help='The number of distinct words in the list')
+    args = parser.parse_args()
+
+    words = word_list(args.lines, args.distinct)
+
+    expected = timed("HanziConv.toSimplified per line", lambda lines: [HanziConv.toSimplified(line) for line in lines],
+                     words)
+
+    results = [
+        timed("to_simplified, empty cache", lambda lines: [conversion.to_simplified(line) for line in lines], words),
+        timed("to_simplified, warm cache", lambda lines: [conversion.to_simplified(line) for line in lines], words),
+        timed("bulk_to_simplified", conversion.bulk_to_simplified, words)
+    ]
+
+    if any(result != expected for result in results):
+        print("The conversions disagree!")
+        sys.exit(1)
+
+    print("All conversions agree.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark for rendering the examples block on a card. Compares what get_examples_html used to do, open and
+compile examples.html.j2 on every page and strip the newlines out afterwards, with the shared rendering layer.
+
+Run it from the root of the repository:
+
+    python benchmarks/bench_render.py --cards 2000 --pages 3
+"""
+
+import sys
+import timeit
+from argparse import ArgumentParser
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from jinja2 import Template  # noqa: E402
+
+import rendering  # noqa: E402
+
+EXAMPLES = [("我<em class=\"highlight\">着</em>急", "wǒ <span class=\"highlight\">zháo</span> jí",
+             "I'm worried")] * 10
+
+
+def render_per_page(pages):
+    template = None
+    for _ in range(pages):
+        template = Template(open(path.join(rendering.TEMPLATE_DIR, rendering.EXAMPLES_TEMPLATE),
+                                 encoding="utf-8").read())
+    return template.render(examples=EXAMPLES).replace('\n', "")
+
+
+def render_shared_unminified():
+    return rendering.get_examples_template().render(examples=EXAMPLES).replace('\n', "")
+
+
+def render_shared():
+    return rendering.render_examples(EXAMPLES)
+
+
+def main():
+    parser = ArgumentParser(description="Benchmarks rendering the examples block of a card")
+    parser.add_argument('--cards', dest="cards", type=int, default=2000, help='The number of cards to render')
+    parser.add_argument('--pages', dest="pages", type=int, default=3,
+                        help='The number of Naver pages visited per word. The old code compiled the template once '
+                             'per page.')
+    args = parser.parse_args()
+
+    before = timeit.timeit(lambda: render_per_page(args.pages), number=args.cards)
+    shared = timeit.timeit(render_shared_unminified, number=args.cards)
+    after = timeit.timeit(render_shared, number=args.cards)
+
+    print("Compile per page:            %.1f us per card" % (before / args.cards * 1e6))
+    print("Shared template:             %.1f us per card" % (shared / args.cards * 1e6))
+    print("Shared template and minify:  %.1f us per card" % (after / args.cards * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures what it costs to start using chinese_flashcard_maker: how long importing it takes, which heavy dependencies
+the import drags in, and the time from a fresh interpreter to the first finished lookup. The lookup goes through
+configure and lookup_card against benchmarks/stub_server.py so nothing real is touched. Every measurement is taken in
+a new process, repeated, and the median reported.
+
+    python benchmarks/bench_startup.py --repeat 10
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from os import path
+
+from stub_server import StubServer
+
+REPOSITORY = path.dirname(path.dirname(path.abspath(__file__)))
+
+HEAVY_MODULES = ["selenium", "bs4", "requests", "htmlmin", "hanziconv", "jinja2", "lxml"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import chinese_flashcard_maker
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "loaded": [name for name in %r if name in sys.modules]}))
+""" % HEAVY_MODULES
+
+FIRST_LOOKUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import chinese_flashcard_maker as maker
+imported = time.perf_counter()
+maker.configure(maker.build_parser().parse_args(%r))
+card = maker.lookup_card(%r)
+finished = time.perf_counter()
+print(json.dumps({"import_seconds": imported - started, "lookup_seconds": finished - imported,
+                  "entries": len(card["entries"])}))
+"""
+
+
+def run_script(script):
+    """
+    Runs a script in a fresh interpreter from the root of the repository
+
+    :return: Returns the JSON the script printed and the wall clock time of the whole process
+    :rtype: tuple
+    """
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", script], cwd=REPOSITORY, capture_output=True, text=True,
+                               check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), time.perf_counter() - started
+
+
+def main():
+    parser = ArgumentParser(description="Measures import time and time to first lookup")
+    parser.add_argument('--repeat', dest="repeat", type=int, default=5, help='How many fresh processes to time')
+    parser.add_argument('--word', dest="word", type=str, default="着急", help='The word to look up')
+    args = parser.parse_args()
+
+    imports = [run_script(IMPORT_SCRIPT) for _ in range(args.repeat)]
+
+    server = StubServer().start()
+    try:
+        lookup_script = FIRST_LOOKUP_SCRIPT % (["--no-cache", "--log-level", "warning"] + server.program_arguments(),
+                                               args.word)
+        lookups = [run_script(lookup_script) for _ in range(args.repeat)]
+    finally:
+        server.stop()
+
+    results = {
+        "import_seconds": statistics.median(result["seconds"] for result, _ in imports),
+        "import_process_seconds": statistics.median(wall for _, wall in imports),
+        "heavy_modules_loaded_by_import": imports[0][0]["loaded"],
+        "first_lookup_seconds": statistics.median(result["lookup_seconds"] for result, _ in lookups),
+        "first_lookup_process_seconds": statistics.median(wall for _, wall in lookups),
+        "entries": lookups[0][0]["entries"]
+    }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Checks that every HTML parser backend gives exactly the same entries, character HTML and examples as the original
+full-tree html.parser code on the saved pages in benchmarks/fixtures, and reports how long each backend takes. It also
+checks that the http example backend, which reads Naver's JSON (naver.json), gives the same examples as the Selenium
+scraper gets from the rendered page (naver.html).
+
+Run it from the root of the repository. It exits with a non-zero status if any backend disagrees:
+
+    python benchmarks/parser_parity.py
+"""
+
+import json
+import sys
+import timeit
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import hanzicraft  # noqa: E402
+import html_parsing  # noqa: E402
+import naver_examples  # noqa: E402
+
+FIXTURES = path.join(path.dirname(path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(name):
+    with open(path.join(FIXTURES, name), encoding="utf-8") as fixture:
+        return fixture.read()
+
+
+def reference_outputs(mdbg, hanzicraft_page, naver):
+    """
+    What the scrapers produced before the parsing layer existed: a full html.parser tree searched with find_all
+    """
+
+    entries = [html_parsing.parse_word_entry(row) for row in
+               BeautifulSoup(mdbg, 'html.parser').find_all("tr", {"class": "row"})]
+
+    html_parsing.set_parser("html.parser")
+    original_display = html_parsing.hanzicraft_display
+    html_parsing.hanzicraft_display = lambda html: BeautifulSoup(html, 'html.parser').find(id="display")
+    try:
+        characters = hanzicraft.process_hanzicraft_page(hanzicraft_page)
+    finally:
+        html_parsing.hanzicraft_display = original_display
+
+    examples = [html_parsing.parse_naver_example(li, "着") for li in
+                BeautifulSoup(naver, 'html.parser').find_all("div", {"class": "example_lst"})[0].find_all("li")]
+
+    return entries, characters, examples
+
+
+def outputs(mdbg, hanzicraft_page, naver):
+    entries = html_parsing.parse_mdbg_entries(mdbg)
+    characters = hanzicraft.process_hanzicraft_page(hanzicraft_page)
+    examples = [html_parsing.parse_naver_example(li, "着") for li in
+                html_parsing.naver_example_lists(naver)[0].find_all("li")]
+    return entries, characters, examples
+
+
+def naver_backends_agree(naver, naver_json, examples):
+    """
+    :param str naver: The rendered Naver page
+    :param str naver_json: The same examples as Naver's JSON endpoint returns them
+    :param list examples: The examples the Selenium scraper gets from the rendered page
+    :return: Returns whether the http backend gives the same examples, with and without a pinyin filter
+    :rtype: bool
+    """
+
+    data = json.loads(naver_json)
+    agree = True
+
+    # scrape_examples keeps the examples whose pinyin contains the word's and parse_example_page does the filtering
+    # itself, so compare both with and without a filter
+    for word_pinyin in ["", "zháo"]:
+        expected = [example for example in examples if word_pinyin in example[1]]
+        actual = naver_examples.parse_example_page(data, "着", word_pinyin)
+
+        if expected != actual:
+            agree = False
+            print("http: naver output differs with pinyin " + repr(word_pinyin))
+            print("  expected: " + repr(expected))
+            print("  actual:   " + repr(actual))
+
+    seconds = timeit.timeit(lambda: naver_examples.parse_example_page(json.loads(naver_json), "着", ""),
+                            number=200) / 200
+    print("http: %.0f us for the Naver JSON page" % (seconds * 1e6))
+
+    return agree
+
+
+def main():
+    mdbg = read_fixture("mdbg.html")
+    hanzicraft_page = read_fixture("hanzicraft.html")
+    naver = read_fixture("naver.html")
+    naver_json = read_fixture("naver.json")
+
+    expected = reference_outputs(mdbg, hanzicraft_page, naver)
+    failed = not naver_backends_agree(naver, naver_json, expected[2])
+
+    for parser in html_parsing.PARSERS:
+        if html_parsing.set_parser(parser) != parser:
+            print(parser + ": not installed, skipped")
+            continue
+
+        actual = outputs(mdbg, hanzicraft_page, naver)
+        seconds = timeit.timeit(lambda: outputs(mdbg, hanzicraft_page, naver), number=200) / 200
+
+        for name, expected_output, actual_output in zip(["mdbg", "hanzicraft", "naver"], expected, actual):
+            if expected_output != actual_output:
+                failed = True
+                print(parser + ": " + name + " output differs")
+                print("  expected: " + repr(expected_output))
+                print("  actual:   " + repr(actual_output))
+
+        print("%s: %.0f us for all three pages" % (parser, seconds * 1e6))
+
+    if failed:
+        sys.exit(1)
+
+    print("All parsers and both example backends agree.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+End to end throughput benchmark. For each list size a synthetic word list is generated and chinese_flashcard_maker.py
+is run against benchmarks/stub_server.py, so no real site is touched. For every run we record words per second, the
+request count, bytes and latency percentiles for each stubbed host, how long each stage kept its host busy and the
+program's peak RSS, along with the per-stage metrics the program records itself with --metrics-out. The results are
+written as JSON so runs from different versions can be compared.
+
+Each size starts with an empty response cache of its own, so no run is answered from an earlier one. With
+--warm-cache each size is run once to fill its cache and then measured on a second run, which shows how fast a
+rebuild from a full cache is.
+
+Run it from the root of the repository:
+
+    python benchmarks/run_benchmark.py --sizes 100 1000 10000 --latency-ms 20 --output bench.json
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from os import path
+
+from stub_server import StubServer
+
+REPOSITORY = path.dirname(path.dirname(path.abspath(__file__)))
+PROGRAM = path.join(REPOSITORY, "chinese_flashcard_maker.py")
+
+# Common characters the synthetic words are built from. Two character words drawn from these give plenty of
+# distinct words while reusing characters the way a real deck does.
+CHARACTERS = "的一是不了人我在有他这中大来上国个到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里" \
+             "后小么心多天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长" \
+             "知民样现分将外但身些与高意进把法此实回二理美点月明其种声全工己话儿者向情部正名定女问力机给等几很业最间"
+
+
+def synthetic_words(count):
+    """
+    :param int count: The number of words to generate
+    :return: Returns count distinct two character words
+    :rtype: list
+    """
+    words = []
+    for index in range(count):
+        first, second = divmod(index, len(CHARACTERS))
+        words.append(CHARACTERS[first % len(CHARACTERS)] + CHARACTERS[second])
+    return words
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once(server, size, work_dir, program_arguments):
+    """
+    Runs the program once against the stub server. Runs of the same size share a response cache which no other size
+    uses.
+
+    :return: Returns the results for the run
+    :rtype: dict
+    """
+
+    input_file = path.join(work_dir, "words_" + str(size) + ".txt")
+    output_file = path.join(work_dir, "deck_" + str(size) + ".txt")
+    metrics_file = path.join(work_dir, "metrics_" + str(size) + ".json")
+
+    with open(input_file, 'w', encoding="utf-8") as words_file:
+        words_file.write("\n".join(synthetic_words(size)) + "\n")
+
+    command = [sys.executable, PROGRAM, "--file", input_file, "--words-output-file", output_file, "--skip-choices",
+               "--journal-file", path.join(work_dir, "journal_" + str(size)), "--log-level", "warning",
+               "--metrics-out", metrics_file, "--cache-dir", path.join(work_dir, "cache_" + str(size))] + \
+        server.program_arguments() + program_arguments
+
+    server.reset()
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=work_dir, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    cards = 0
+    if path.isfile(output_file):
+        with open(output_file, encoding="utf-8-sig") as deck:
+            cards = sum(1 for _ in deck)
+
+    stages = None
+    if path.isfile(metrics_file):
+        with open(metrics_file, encoding="utf-8") as recorded:
+            stages = json.load(recorded)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss * (1 if platform.system() == "Darwin" else 1024)
+
+    return {
+        "words": size,
+        "cards": cards,
+        "exit_code": process.returncode,
+        "seconds": elapsed,
+        "words_per_second": size / elapsed if elapsed else None,
+        "peak_rss_bytes": peak_rss,
+        "hosts": server.stats(),
+        "metrics": stages
+    }
+
+
+def main():
+    parser = ArgumentParser(description="Benchmarks chinese_flashcard_maker.py end to end against a local stub server")
+    parser.add_argument('--sizes', dest="sizes", type=int, nargs='+', default=[100, 1000, 10000],
+                        help='The word list sizes to run')
+    parser.add_argument('--latency-ms', dest="latency_ms", type=float, default=20,
+                        help='Milliseconds the stub server waits before answering each request')
+    parser.add_argument('--naver-pages', dest="naver_pages", type=int, default=2,
+                        help='How many pages of examples each word has on the stub')
+    parser.add_argument('--output', dest="output", type=str, default=None,
+                        help='Write the results to this JSON file as well as printing them')
+    parser.add_argument('--warm-cache', dest="warm_cache", action='store_true', default=False,
+                        help='Fill each size\'s response cache with an unmeasured run first and measure a second run '
+                             'answered from it')
+    parser.add_argument('program_arguments', nargs='*',
+                        help='Extra arguments for chinese_flashcard_maker.py. Put them after --. Ex: -- --no-cache '
+                             '--thread-count 10')
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency_ms / 1000, naver_pages=args.naver_pages).start()
+
+    results = {"revision": git_revision(), "latency_ms": args.latency_ms, "naver_pages": args.naver_pages,
+               "cache": "warm" if args.warm_cache else "cold", "program_arguments": args.program_arguments,
+               "runs": []}
+
+    print("Every run starts with a " + results["cache"] + " response cache.")
+
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for size in args.sizes:
+                if args.warm_cache:
+                    run_once(server, size, work_dir, args.program_arguments)
+                run = run_once(server, size, work_dir, args.program_arguments)
+                results["runs"].append(run)
+                print("%6d words: %8.2f s, %8.1f words/s, %4d MB peak RSS, exit code %d" %
+                      (size, run["seconds"], run["words_per_second"], run["peak_rss_bytes"] // (1024 * 1024),
+                       run["exit_code"]))
+                for host, stats in run["hosts"].items():
+                    print("         %-10s %6d requests, p50 %7.1f ms, p95 %7.1f ms, busy for %.2f s" %
+                          (host, stats["requests"], stats["p50_ms"], stats["p95_ms"], stats["span_s"]))
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+A local stand-in for mdbg.net, hanzicraft.com, Naver's example endpoint and the character history API. It serves the
+recorded pages in benchmarks/fixtures, with the requested word filled in, after an optional injected delay and keeps
+per-host request counts, bytes and latencies.
+
+It can be run on its own to point the program at by hand:
+
+    python benchmarks/stub_server.py --port 8000 --latency-ms 50
+"""
+
+import json
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from os import path
+from urllib.parse import urlparse, parse_qs, unquote
+
+FIXTURES = path.join(path.dirname(path.abspath(__file__)), "fixtures")
+
+MDBG_PATH = "/chinese/dictionary"
+HANZICRAFT_PATH = "/character/"
+NAVER_PATH = "/linedict/cnen/example/search.dict"
+HISTORY_PATH = "/api/lookup"
+
+
+def read_fixture(name):
+    with open(path.join(FIXTURES, name), encoding="utf-8") as fixture:
+        return fixture.read()
+
+
+def percentile(values, fraction):
+    """
+    :param list values: The values to take the percentile of
+    :param float fraction: Ex: 0.95 for the 95th percentile
+    :return: Returns the nearest-rank percentile or None if there are no values
+    :rtype: float
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class StubServer:
+    """
+    Serves the fixtures on a background thread
+    """
+
+    def __init__(self, port=0, latency=0.0, naver_pages=2):
+        """
+        :param int port: The port to listen on. 0 picks a free one.
+        :param float latency: Seconds to wait before answering every request
+        :param int naver_pages: How many pages of examples each word has on the Naver stub
+        """
+        self.latency = latency
+        self.naver_pages = naver_pages
+
+        self.mdbg_page = read_fixture("mdbg_single.html")
+        self.hanzicraft_page = read_fixture("hanzicraft.html")
+        self.naver_page = read_fixture("naver_template.json")
+
+        self._lock = threading.Lock()
+        self._requests = []  # type: list
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub.handle(self)
+
+            def do_PUT(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:" + str(self._server.server_port)
+
+    def program_arguments(self):
+        """
+        :return: Returns the command line arguments which point chinese_flashcard_maker.py at this server
+        :rtype: list
+        """
+        return ["--mdbg-url", self.base_url + MDBG_PATH + "?page=worddict&wdrst=1&wdqb=",
+                "--hanzicraft-backend", "http", "--hanzicraft-url", self.base_url + HANZICRAFT_PATH,
+                "--example-backend", "http", "--naver-api-url", self.base_url + NAVER_PATH,
+                "--api-address", "127.0.0.1:" + str(self._server.server_port)]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self._requests = []
+
+    def respond(self, request_path, query, body):
+        """
+        :return: Returns a tuple of (host, status, content type, body)
+        """
+
+        if request_path == MDBG_PATH:
+            word = query.get("wdqb", [""])[0]
+            return "mdbg", 200, "text/html; charset=utf-8", self.mdbg_page.replace("{{word}}", word)
+
+        if request_path.startswith(HANZICRAFT_PATH):
+            characters = unquote(request_path[len(HANZICRAFT_PATH):])
+            return "hanzicraft", 200, "text/html; charset=utf-8", self.hanzicraft_page.replace("間", characters)
+
+        if request_path == NAVER_PATH:
+            word = query.get("query", [""])[0]
+            if int(query.get("page", ["1"])[0]) > self.naver_pages:
+                return "naver", 200, "application/json", json.dumps({"exampleList": []})
+            return "naver", 200, "application/json", self.naver_page.replace("{{word}}", word)
+
+        if request_path == HISTORY_PATH:
+            characters = json.loads(body)["characters_to_lookup"]
+            results = [{"character": character,
+                        "explanation": character + " is made up of 口 and 木. It originally meant a tree."}
+                       for character in characters]
+            return "history", 200, "application/json", json.dumps(results)
+
+        return "unknown", 404, "text/plain", "Not found"
+
+    def handle(self, handler):
+        started = time.perf_counter()
+
+        parsed = urlparse(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length).decode("utf-8") if length else ""
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        host, status, content_type, response = self.respond(parsed.path, parse_qs(parsed.query), body)
+        encoded = response.encode("utf-8")
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(encoded)))
+        handler.end_headers()
+        handler.wfile.write(encoded)
+
+        with self._lock:
+            self._requests.append((host, started, time.perf_counter() - started, len(encoded)))
+
+    def stats(self):
+        """
+        :return: Returns request counts, bytes sent, latency percentiles in milliseconds and the time between the
+                 first and last request for each host
+        :rtype: dict
+        """
+
+        with self._lock:
+            requests = list(self._requests)
+
+        stats = {}
+        for host in sorted(set(request[0] for request in requests)):
+            host_requests = [request for request in requests if request[0] == host]
+            latencies = [request[2] * 1000 for request in host_requests]
+            stats[host] = {
+                "requests": len(host_requests),
+                "bytes": sum(request[3] for request in host_requests),
+                "p50_ms": percentile(latencies, 0.50),
+                "p95_ms": percentile(latencies, 0.95),
+                "span_s": max(request[1] + request[2] for request in host_requests) -
+                min(request[1] for request in host_requests)
+            }
+
+        return stats
+
+
+def main():
+    parser = ArgumentParser(description="Serves recorded MDBG, hanzicraft, Naver and history API responses")
+    parser.add_argument('--port', dest="port", type=int, default=8000, help='The port to listen on')
+    parser.add_argument('--latency-ms', dest="latency_ms", type=float, default=0,
+                        help='Milliseconds to wait before answering each request')
+    parser.add_argument('--naver-pages', dest="naver_pages", type=int, default=2,
+                        help='How many pages of examples each word has')
+    args = parser.parse_args()
+
+    server = StubServer(args.port, args.latency_ms / 1000, args.naver_pages)
+    print("Serving on " + server.base_url + ". Point the program at it with:")
+    print(" ".join(server.program_arguments()))
+    server.start()
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
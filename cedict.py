@@ -0,0 +1,179 @@
+"""
+An offline replacement for the MDBG lookups. MDBG's data is essentially CC-CEDICT plus the HSK word lists so we load
+those into a SQLite index once, keyed on both the traditional and simplified forms, and answer lookups from it. The
+entries returned look exactly like the ones parse_word_entry builds from the MDBG page.
+
+CC-CEDICT can be downloaded from https://www.mdbg.net/chinese/dictionary?page=cc-cedict. Lines look like:
+
+    瞬間 瞬间 [shun4 jian1] /moment/momentary/in the twinkling of an eye/
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+from os import path
+
+from pinyin import to_mdbg_pinyin
+
+_line = re.compile(r"^(\S+) (\S+) \[([^\]]*)\] /(.*)/\s*$")
+_level = re.compile(r"(\d+)")
+
+SCHEMA_VERSION = 1
+
+
+def parse_cedict_line(line):
+    """
+    Parses a line of CC-CEDICT
+
+    :param str line: A line from the CC-CEDICT file
+    :return: Returns a tuple of (traditional, simplified, numbered pinyin, defs) or None for comments and blank lines
+    :rtype: tuple
+    """
+
+    if line.startswith("#"):
+        return None
+
+    match = _line.match(line)
+    if match is None:
+        return None
+
+    return match.group(1), match.group(2), match.group(3), match.group(4)
+
+
+def read_hsk_lists(hsk_lists):
+    """
+    Reads HSK word lists. Each file has one word per line and its level is the first number in its name, so
+    hsk_4.txt holds the HSK 4 words.
+
+    :param list hsk_lists: The paths to the HSK lists
+    :return: Returns a dictionary mapping each word to its HSK level
+    :rtype: dict
+    """
+
+    levels = {}
+
+    for hsk_list in hsk_lists:
+        level = _level.search(path.basename(hsk_list))
+        if level is None:
+            logging.warning("Can't tell the HSK level of " + hsk_list + " from its name. Skipping it.")
+            continue
+
+        with open(hsk_list, encoding="utf-8-sig") as hsk_file:
+            for word in hsk_file:
+                word = word.split("\t")[0].strip()
+                if word and word not in levels:
+                    levels[word] = level.group(1)
+
+    return levels
+
+
+def build_index(cedict_file, index_file, hsk_lists=()):
+    """
+    Builds the SQLite index from a CC-CEDICT file and HSK lists
+
+    :param str cedict_file: The path to the CC-CEDICT file
+    :param str index_file: Where to write the index
+    :param list hsk_lists: The paths to the HSK lists. See read_hsk_lists.
+    :return: Returns nothing
+    """
+
+    logging.info("Building the CC-CEDICT index " + index_file + " from " + cedict_file + ".")
+
+    levels = read_hsk_lists(hsk_lists)
+
+    connection = sqlite3.connect(index_file)
+    connection.execute("DROP TABLE IF EXISTS entries")
+    connection.execute("CREATE TABLE entries (id INTEGER PRIMARY KEY, traditional TEXT NOT NULL, "
+                       "simplified TEXT NOT NULL, pinyin TEXT NOT NULL, defs TEXT NOT NULL, hsk TEXT NOT NULL)")
+
+    rows = []
+    with open(cedict_file, encoding="utf-8") as cedict:
+        for line in cedict:
+            parsed = parse_cedict_line(line)
+            if parsed is None:
+                continue
+
+            traditional, simplified, numbered_pinyin, defs = parsed
+            level = levels.get(simplified, levels.get(traditional))
+            hsk = "HSK " + level if level is not None else ""
+
+            rows.append((traditional, simplified, to_mdbg_pinyin(numbered_pinyin), defs, hsk))
+
+    connection.executemany("INSERT INTO entries (traditional, simplified, pinyin, defs, hsk) VALUES (?, ?, ?, ?, ?)",
+                           rows)
+    connection.execute("CREATE INDEX entries_traditional ON entries (traditional)")
+    connection.execute("CREATE INDEX entries_simplified ON entries (simplified)")
+    connection.execute("PRAGMA user_version = " + str(SCHEMA_VERSION))
+    connection.commit()
+    connection.close()
+
+    logging.info("Indexed " + str(len(rows)) + " CC-CEDICT entries.")
+
+
+class CedictDictionary:
+    """
+    Answers lookups from the CC-CEDICT index. The index is built, if it is missing or older than its sources, and
+    opened the first time a lookup is made. It is safe to share one instance between threads.
+    """
+
+    def __init__(self, cedict_file, index_file=None, hsk_lists=()):
+        """
+        :param str cedict_file: The path to the CC-CEDICT file
+        :param str index_file: Where the index lives. Defaults to the CC-CEDICT file with .sqlite3 added.
+        :param list hsk_lists: The paths to the HSK lists. See read_hsk_lists.
+        """
+        self.cedict_file = cedict_file
+        self.index_file = index_file or cedict_file + ".sqlite3"
+        self.hsk_lists = list(hsk_lists)
+
+        self._connection = None  # type: sqlite3.Connection
+        self._lock = threading.Lock()
+
+    def _index_is_stale(self):
+        if not path.isfile(self.index_file):
+            return True
+
+        index_time = path.getmtime(self.index_file)
+        for source in [self.cedict_file] + self.hsk_lists:
+            if path.getmtime(source) > index_time:
+                return True
+
+        connection = sqlite3.connect(self.index_file)
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        connection.close()
+
+        return version != SCHEMA_VERSION
+
+    def _connect(self):
+        if self._connection is None:
+            if self._index_is_stale():
+                build_index(self.cedict_file, self.index_file, self.hsk_lists)
+            self._connection = sqlite3.connect("file:" + self.index_file + "?mode=ro", uri=True,
+                                               check_same_thread=False)
+        return self._connection
+
+    def lookup(self, word):
+        """
+        Finds every entry whose traditional or simplified form is the word
+
+        :param str word: The word to look up in either traditional or simplified characters
+        :return: Returns a list of entries shaped like the ones parse_word_entry returns, in CC-CEDICT order
+        :rtype: list of dicts
+        """
+
+        with self._lock:
+            rows = self._connect().execute("SELECT traditional, simplified, pinyin, defs, hsk FROM entries "
+                                           "WHERE traditional = ? OR simplified = ? ORDER BY id",
+                                           (word, word)).fetchall()
+
+        entries = []
+        for traditional, simplified, entry_pinyin, defs, hsk in rows:
+            entries.append({"characters": [],
+                            "traditional": traditional,
+                            "pinyin": entry_pinyin,
+                            "defs": list(map(str.strip, defs.split('/'))),
+                            "simplified": simplified,
+                            "hsk": hsk})
+
+        return entries
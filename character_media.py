@@ -0,0 +1,99 @@
+"""
+Shared character HTML. Every card inlines the hanzicraft breakdown and the history of each of its characters, so a
+character that shows up in 50 words is copied into the deck 50 times. With --character-media each distinct block is
+written once to the Anki media folder, or into the .apkg, as a small script named after a hash of its contents and
+the cards just include the script:
+
+    <script src="_hc_1f3a9c0e5b7d2468.js"></script>
+
+When the card is shown the script puts the block back where the include is, so the card looks exactly as it did.
+That only works where card JavaScript runs and supports document.currentScript. Anywhere else the block is simply
+missing, and since the text is no longer in the fields Anki's search can't find it either. That is why
+--character-media is off unless asked for.
+Anki keeps media whose names start with an underscore even though no field refers to them by name, and since the
+names come from the contents, building again, or building another deck, reuses the same files.
+"""
+
+import hashlib
+import json
+from os import path
+
+PREFIX = "_hc_"
+
+
+def fragment_name(html):
+    """
+    :param str html: A block of character HTML
+    :return: Returns the media file name for the block
+    :rtype: str
+    """
+    return PREFIX + hashlib.sha256(html.encode("utf-8")).hexdigest()[:16] + ".js"
+
+
+def fragment_script(html):
+    """
+    :param str html: A block of character HTML
+    :return: Returns the script which inserts the block in place of the tag that included it
+    :rtype: bytes
+    """
+    return ("document.currentScript.insertAdjacentHTML(\"beforebegin\", " + json.dumps(html) + ");").encode("utf-8")
+
+
+def media_folder_saver(media_dir):
+    """
+    :param str media_dir: The Anki collection.media folder
+    :return: Returns a function for CharacterMedia which writes fragments into the folder. Fragments that are already
+             there are left alone since a file with the same name has the same contents.
+    """
+
+    def save(file_name, data):
+        file_path = path.join(media_dir, file_name)
+        if not path.isfile(file_path):
+            with open(file_path, 'wb') as fragment_file:
+                fragment_file.write(data)
+
+    return save
+
+
+class CharacterMedia:
+    """
+    Turns blocks of character HTML into references to media fragments, saving each distinct block once. Used from
+    the thread writing the cards.
+    """
+
+    def __init__(self, save):
+        """
+        :param save: A function taking a file name and its contents as bytes which stores a fragment. Ex:
+                     anki_package.AnkiPackage.add_media or media_folder_saver(media_dir)
+        """
+        self._save = save
+        self._saved = set()  # type: set
+        self.references = 0
+
+    def reference(self, html):
+        """
+        :param str html: A block of character HTML
+        :return: Returns the tag which includes the block. Empty blocks stay empty.
+        :rtype: str
+        """
+
+        if not html:
+            return html
+
+        file_name = fragment_name(html)
+
+        if file_name not in self._saved:
+            self._save(file_name, fragment_script(html))
+            self._saved.add(file_name)
+
+        self.references = self.references + 1
+
+        return "<script src=\"" + file_name + "\"></script>"
+
+    @property
+    def fragments(self):
+        """
+        :return: Returns the number of distinct fragments saved
+        :rtype: int
+        """
+        return len(self._saved)
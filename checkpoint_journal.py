@@ -0,0 +1,143 @@
+"""
+An append-only journal of finished work. Every word lookup and every example render is written to the journal as a
+line of JSON the moment it completes. If the program dies, running it again with --resume replays the journal and
+only the work that hadn't finished yet is redone.
+
+A word is journaled twice. Its selection is recorded as soon as the entries are chosen, so the answers to any prompts
+survive a crash, and the word is recorded again once the history and hanzicraft breakdown have been added.
+"""
+
+import json
+import logging
+import threading
+from os import path
+
+WORD = "word"
+SELECTION = "selection"
+EXAMPLES = "examples"
+
+
+class CheckpointJournal:
+    """
+    JSON lines journal of completed word lookups and example renders. It is safe to share one instance between
+    threads.
+    """
+
+    def __init__(self, journal_path, resume=False):
+        """
+        :param str journal_path: The file the journal is kept in
+        :param bool resume: If true, the existing journal is loaded and added to. Otherwise it is started fresh.
+        """
+
+        self.journal_path = journal_path
+        self._words = {}  # type: dict
+        self._selections = {}  # type: dict
+        self._examples = {}  # type: dict
+        self._lock = threading.Lock()
+
+        if resume and path.isfile(journal_path):
+            self._load()
+            logging.info("Resuming from " + journal_path + ". " + str(len(self._words)) + " words and " +
+                         str(len(self._examples)) + " examples were already finished.")
+            self._file = open(journal_path, 'a', encoding="utf-8")
+        else:
+            if resume:
+                logging.warning("There is no journal at " + journal_path + " to resume from. Starting over.")
+            self._file = open(journal_path, 'w', encoding="utf-8")
+
+    def _load(self):
+        with open(self.journal_path, encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be cut short if we died while writing it. That work just gets redone.
+                    logging.debug("Skipping an incomplete line in the journal.")
+                    continue
+
+                if record["type"] == WORD:
+                    self._words[record["key"]] = record["value"]
+                elif record["type"] == SELECTION:
+                    self._selections[record["key"]] = record["value"]
+                elif record["type"] == EXAMPLES:
+                    self._examples[record["key"]] = record["value"]
+
+    def _append(self, record_type, key, value):
+        line = json.dumps({"type": record_type, "key": key, "value": value}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def completed_word(self, word):
+        """
+        :param str word: The word as it appeared in the input list
+        :return: Returns the entries recorded for the word or None if the word hasn't been looked up yet
+        :rtype: list
+        """
+        return self._words.get(word)
+
+    def selected_word(self, word):
+        """
+        :param str word: The word as it appeared in the input list
+        :return: Returns the entries chosen for the word, before they were enriched, or None if nothing has been
+                 chosen yet
+        :rtype: list
+        """
+        return self._selections.get(word)
+
+    def record_selection(self, word, entries):
+        """
+        Records which entries were chosen for a word before anything else is done with them
+
+        :param str word: The word as it appeared in the input list
+        :param list entries: The entries returned by process_word. An empty list means the word was skipped.
+        :return: Returns nothing
+        """
+        self._selections[word] = entries
+        self._append(SELECTION, word, entries)
+
+    def record_word(self, word, entries):
+        """
+        Records that a word has been looked up and which entries were chosen for it
+
+        :param str word: The word as it appeared in the input list
+        :param list entries: The entries returned by process_word. An empty list means the word was skipped.
+        :return: Returns nothing
+        """
+        self._words[word] = entries
+        self._append(WORD, word, entries)
+
+    def completed_examples(self, key):
+        """
+        :param str key: Identifies the examples. See examples_key.
+        :return: Returns the rendered examples or None if they haven't been rendered yet
+        :rtype: str
+        """
+        return self._examples.get(key)
+
+    def record_examples(self, key, examples_html):
+        """
+        Records the rendered examples for a word
+
+        :param str key: Identifies the examples. See examples_key.
+        :param str examples_html: The rendered examples
+        :return: Returns nothing
+        """
+        self._examples[key] = examples_html
+        self._append(EXAMPLES, key, examples_html)
+
+    def close(self):
+        """
+        :return: Returns nothing
+        """
+        with self._lock:
+            self._file.close()
+
+
+def examples_key(word):
+    """
+    :param dict word: An entry as returned by process_word
+    :return: Returns the key under which the entry's examples are journaled
+    :rtype: str
+    """
+    return word["simplified"] + "\t" + word["pinyin"]
@@ -4,37 +4,88 @@ __license__ = "GPLv3"
 __version__ = "2.1"
 __maintainer__ = "Grant Curell"
 
+import io
 import json
-import subprocess
 from argparse import ArgumentParser
 from pathlib import Path
 from concurrent.futures.thread import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
 from urllib.request import urlopen
 from urllib.parse import quote, urljoin
-from bs4 import BeautifulSoup
-from hanziconv import HanziConv
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
-from jinja2 import Template
-from os import path, getenv, name
-import bs4
+from os import path, getenv
 import concurrent.futures
 import traceback
 import sys
 import platform
-import pickle
 import logging
 import re
-import requests
-import htmlmin
 import ssl
+import atexit
+import response_cache
+import naver_examples
+import rendering
+import metrics
+import html_parsing
+import deck_manifest
+import anki_package
+import character_media
+from character_media import CharacterMedia
+import conversion
+import pinyin
+import cpu_pool
+import request_scheduler
+import lookup_server
+from checkpoint_journal import CheckpointJournal, examples_key
+from cedict import CedictDictionary
+from history_client import HistoryClient, HistoryUnavailable
+import hanzicraft
+from hanzicraft import CharacterRegistry
+from driver_pool import DriverPool, DEFAULT_MAX_USES
 
-ssl._create_default_https_context = ssl._create_unverified_context
 IMPLICIT_WAIT_TIME = 5
+PAGE_LOAD_TIMEOUT = 30
+MDBG_TIMEOUT = 30
 MAX_HANZICRAFT_EXAMPLES = 10
 
+# The parsed command line options. Set by configure.
+args = None
 
-def create_driver(headless=True, binary_location=None, implicit_wait_time=IMPLICIT_WAIT_TIME) -> webdriver:
+# The Anki media folder. Only known on Windows.
+image_path = None  # type: str
+
+# Set to a response_cache.ResponseCache at startup unless caching has been turned off with --no-cache
+cache = None  # type: response_cache.ResponseCache
+
+
+# The browsers used for hanzicraft and the registry which makes sure each hanzicraft page is only processed once
+hanzicraft_drivers = None  # type: DriverPool
+hanzicraft_registry = None  # type: CharacterRegistry
+
+# Set to a history_client.HistoryClient for --api-address at startup
+history_client = None  # type: HistoryClient
+
+# Set to a cedict.CedictDictionary at startup when --dictionary-backend cedict is used. Otherwise we go to MDBG.
+dictionary = None  # type: CedictDictionary
+
+
+def cached_fetch(source, query, fetch):
+    """
+    Returns the cached response for a query if there is one. Otherwise calls fetch and caches the result.
+
+    :param str source: The name of the source the response comes from. Ex: mdbg
+    :param str query: The query being sent to the source. It should include the endpoint, and the backend if there is
+                      more than one, so that answers from a stub server or another backend are kept apart.
+    :param fetch: A function taking no arguments which goes out to the network and returns the response as a string
+    :return: Returns the response
+    :rtype: str
+    """
+    if cache is None:
+        return fetch()
+    return cache.get_or_fetch(source, query, fetch)
+
+
+def create_driver(headless=True, binary_location=None, implicit_wait_time=IMPLICIT_WAIT_TIME):
     """
     Creates a Google Chrome-based web driver
 
@@ -44,6 +95,8 @@ def create_driver(headless=True, binary_location=None, implicit_wait_time=IMPLIC
                                    for results to return.
     :return: Returns a type of selenium.webdriver.chrome.webdriver.WebDriver for use in opening a chrome browser
     """
+    from selenium import webdriver
+
     options = webdriver.ChromeOptions()
     options.add_argument('--ignore-certificate-errors')
     options.add_argument("--test-type")
@@ -60,56 +113,55 @@ def create_driver(headless=True, binary_location=None, implicit_wait_time=IMPLIC
     # This means the driver will wait up to 10 seconds to find a designated element.
     driver.implicitly_wait(implicit_wait_time)
 
+    # Without this a page that never finishes loading holds its browser forever. A page load that times out is
+    # retried by request_scheduler.
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+
     return driver
 
 
-def get_examples_html(word, word_pinyin, example_driver=None, is_server=True, max_page=20, show_chrome=False):
+class ExampleScrapeError(Exception):
     """
-    Reach out to https://dict.naver.com/linedict/zhendict/dict.html#/cnen/example?query=%E4%B8%BA%E7%9D%80
-    and get example sentences.
-
-    :param str word: The word_to_process, in traditional character format, for which you want to retrieve examples
-    :param str word_pinyin: The pinyin of the word_to_process - to make sure if there are multiple variants you get a matching
-                            variant
-    :param selenium.webdriver.chrome.webdriver.WebDriver driver: The webdriver we want to use to generate the example
-    :param bool is_server: Determines if the function is being called from a server or not.
-    :param int max_page: The maximum number of pages in which to search for examples
-    :param bool show_chrome: Used to determine whether to show the browser or not
-    :return Returns a template string with all of the examples formatted within it.
-    :rtype str
+    Raised when Naver doesn't give us something we can pull examples out of. The message is what ends up on the card.
     """
+    pass
 
-    template = None
-
-    logging.info("Creating an example for " + word)
-
-    logging.info("Requested word_to_process is: " + word)
-    logging.debug("URL is: https://dict.naver.com/linedict/zhendict/dict.html#/cnen/example?query=" + word)
-
-    url_string = "https://dict.naver.com/linedict/zhendict/dict.html#/cnen/example?query=" \
-                 + quote(word)  # type: str
 
-    if not is_server:
-        example_driver = create_driver()
+class ExampleFailure(str):
+    """
+    The message put on a card in place of examples we couldn't get. It goes on the card like any rendered examples
+    but is never journaled, so --resume tries the word again.
+    """
+    pass
 
-    example_driver.get(url_string)
 
-    i = 0
+def scrape_examples(example_driver, url_string, word, word_pinyin, max_page=20):
+    """
+    Drives a browser through the Naver example pages for a word and collects the examples whose pinyin matches
 
-    # This forces Chrome to wait to return until an element with class name autolink appears. Autolink in this case
-    # Autolink is the name of the span class in the examples.
-    while i < 2:
-        try:
-            example_driver.find_element_by_class_name("autolink")
-            i = 2
-        except NoSuchElementException:
-            if i < 2:
-                i = i + 1
-                example_driver.get(url_string)
-            else:
-                if not is_server:
-                    example_driver.quit()
-                return "No examples found for that word_to_process or finding an example took longer than 5 seconds."
+    :param selenium.webdriver.chrome.webdriver.WebDriver example_driver: The webdriver used to load the pages
+    :param str url_string: The URL of the first page of examples
+    :param str word: The word_to_process for which you want to retrieve examples
+    :param str word_pinyin: The pinyin of the word_to_process - only examples with this pinyin are kept
+    :param int max_page: The maximum number of pages in which to search for examples
+    :return: Returns a list of (chinese_sentence, pinyin, translation) tuples
+    :rtype: list
+    """
+    from selenium.common.exceptions import NoSuchElementException
+
+    def load_first_page():
+        example_driver.get(url_string)
+        # This forces Chrome to wait to return until an element with class name autolink appears. Autolink in this
+        # case Autolink is the name of the span class in the examples.
+        example_driver.find_element_by_class_name("autolink")
+
+    # A page without examples is reloaded twice, as it always has been, but within Naver's limits and with backoff
+    try:
+        with metrics.stage("naver_fetch"):
+            request_scheduler.call("naver", load_first_page, retry_on=(NoSuchElementException,), max_retries=2)
+    except NoSuchElementException:
+        pass
+    pages_visited = 1
 
     examples = []
     examples_found = False
@@ -117,43 +169,27 @@ def get_examples_html(word, word_pinyin, example_driver=None, is_server=True, ma
     i = 0
     while not examples_found:
 
-        html = example_driver.page_source
-
-        soup = BeautifulSoup(html, 'html.parser')  # type: bs4.BeautifulSoup
-
-        results = soup.find_all("div", {"class": "example_lst"})  # type: bs4.element.ResultSet
+        # Parsed in the CPU stage so the browser's thread only waits on the parse rather than doing it
+        with metrics.stage("naver_parse"):
+            page_examples = cpu_pool.run(html_parsing.parse_naver_page, example_driver.page_source, word)
 
-        if len(results) > 1:
-            if not is_server:
-                example_driver.quit()
-            return "The HTML contained more than one div with class \"example_lst\" which shouldn't happen. Has their " \
-                   "HTML changed? This error prevents us from continuing to generate an example."
+        if page_examples is None:
+            raise ExampleScrapeError("The HTML contained more than one div with class \"example_lst\" which "
+                                     "shouldn't happen. Has their HTML changed? This error prevents us from "
+                                     "continuing to generate an example.")
 
-        for example in results[0].find_all("li"):
+        for chinese_sentence, pinyin, translation in page_examples:
 
             # We don't need more than five examples.
             if i >= MAX_HANZICRAFT_EXAMPLES:
                 examples_found = True
                 break
 
-            data = example.find("div", {"class": "exam"})
-
-            chinese_sentence = data.find("p", {"class": "stc"}).text.split(" ")
-            del chinese_sentence[-2:]
-            chinese_sentence = "".join(chinese_sentence).replace(word, "<em class=\"highlight\">" + word + "</em>")
-
-            # I know the way I did this is gross. Sue me.
-            pinyin = str(data.find("p", {"class": "pinyin"})).replace("<p class=\"pinyin\">", "").replace("</p>", "") \
-                .replace("hl", "highlight")
-            translation = data.find("p", {"class": "trans"}).text
-
             if word_pinyin in pinyin:
                 examples.append((chinese_sentence, pinyin, translation))
                 i = i + 1
                 logging.debug("Character pinyin did not match example. Skipping this example.")
 
-        template = Template(open('examples.html.j2', encoding="utf-8").read())
-
         if not examples_found:
             logging.debug("Not all examples found. Moving to next page.")
             try:
@@ -165,12 +201,16 @@ def get_examples_html(word, word_pinyin, example_driver=None, is_server=True, ma
                 # If we want to get the next page we can just manually change the page via the below.
                 split_url = example_driver.current_url.split("page=")
                 if len(split_url) == 1:
-                    example_driver.get(split_url[0] + "&page=2")
+                    with metrics.stage("naver_fetch"):
+                        request_scheduler.call("naver", example_driver.get, split_url[0] + "&page=2")
+                    pages_visited = pages_visited + 1
                 else:
                     # split_url[1] contains the page number in the URL
                     page = int(split_url[1]) + 1
                     if page < max_page:
-                        example_driver.get(split_url[0] + "page=" + str(page))
+                        with metrics.stage("naver_fetch"):
+                            request_scheduler.call("naver", example_driver.get, split_url[0] + "page=" + str(page))
+                        pages_visited = pages_visited + 1
                     else:
                         logging.info("Checked " + str(page) + " pages looking for " + word + " (" + word_pinyin +
                                      ") and did not reach requested number of examples")
@@ -182,13 +222,136 @@ def get_examples_html(word, word_pinyin, example_driver=None, is_server=True, ma
                 else:
                     "No examples found for that word_to_process or finding an example took longer than 5 seconds."
 
-    if not is_server:
-        example_driver.quit()
+    metrics.observe("naver_pages_per_word", pages_visited)
 
-    if template is None:
-        return None
-    else:
-        return template.render(examples=examples)
+    return examples
+
+
+def get_examples_html(word, word_pinyin, **kwargs):
+    """
+    Gets the examples for a word and waits for them to be rendered. See submit_examples_html.
+
+    :param str word: The word_to_process, in traditional character format, for which you want to retrieve examples
+    :param str word_pinyin: The pinyin of the word_to_process
+    :param kwargs: Passed through to submit_examples_html
+    :return Returns a minified template string with all of the examples formatted within it or an ExampleFailure
+    :rtype str
+    """
+    return submit_examples_html(word, word_pinyin, **kwargs).result()
+
+
+def submit_examples_html(word, word_pinyin, example_driver=None, is_server=True, max_page=20, show_chrome=False,
+                         driver_pool=None, backend="selenium", naver_api_url=naver_examples.NAVER_EXAMPLE_API,
+                         naver_prefetch=naver_examples.DEFAULT_PREFETCH):
+    """
+    Reach out to https://dict.naver.com/linedict/zhendict/dict.html#/cnen/example?query=%E4%B8%BA%E7%9D%80
+    and get example sentences.
+
+    :param str word: The word_to_process, in traditional character format, for which you want to retrieve examples
+    :param str word_pinyin: The pinyin of the word_to_process - to make sure if there are multiple variants you get a matching
+                            variant
+    :param selenium.webdriver.chrome.webdriver.WebDriver driver: The webdriver we want to use to generate the example
+    :param bool is_server: Determines if the function is being called from a server or not.
+    :param int max_page: The maximum number of pages in which to search for examples
+    :param bool show_chrome: Used to determine whether to show the browser or not
+    :param driver_pool.DriverPool driver_pool: If provided, a driver is checked out of this pool instead of using
+                                               example_driver or creating a new one
+    :param str backend: Either selenium, to render the Naver page in a browser, or http, to ask Naver's JSON
+                        endpoint directly. The http backend doesn't need a driver at all.
+    :param str naver_api_url: The JSON endpoint used by the http backend
+    :param int naver_prefetch: The most example pages the http backend fetches at once for this word
+    :return Returns a future for a minified template string with all of the examples formatted within it. If the
+            examples couldn't be fetched the future holds an ExampleFailure with the reason instead. The examples are
+            fetched before this returns but may still be rendering in the CPU stage.
+    :rtype concurrent.futures.Future
+    """
+    import requests
+
+    logging.info("Creating an example for " + word)
+
+    logging.info("Requested word_to_process is: " + word)
+    logging.debug("URL is: https://dict.naver.com/linedict/zhendict/dict.html#/cnen/example?query=" + word)
+
+    url_string = "https://dict.naver.com/linedict/zhendict/dict.html#/cnen/example?query=" \
+                 + quote(word)  # type: str
+
+    # Keyed on the backend and endpoint too so a stub server's answers never stand in for Naver's
+    cache_query = backend + " " + (naver_api_url if backend == "http" else url_string) + " " + word + " " + \
+        word_pinyin + " " + str(max_page)
+
+    if cache is not None:
+        cached_examples = cache.get("naver", cache_query)
+        if cached_examples is not None:
+            logging.debug("Using cached examples for " + word)
+            return cpu_pool.submit(rendering.render_examples, json.loads(cached_examples))
+
+    try:
+        if backend == "http":
+            examples = naver_examples.get_examples(word, word_pinyin, MAX_HANZICRAFT_EXAMPLES, max_page=max_page,
+                                                   base_url=naver_api_url, prefetch=naver_prefetch)
+        elif driver_pool is not None:
+            with driver_pool.checkout() as pooled_driver:
+                examples = scrape_examples(pooled_driver, url_string, word, word_pinyin, max_page=max_page)
+        elif is_server:
+            examples = scrape_examples(example_driver, url_string, word, word_pinyin, max_page=max_page)
+        else:
+            example_driver = create_driver(headless=not show_chrome)
+            try:
+                examples = scrape_examples(example_driver, url_string, word, word_pinyin, max_page=max_page)
+            finally:
+                example_driver.quit()
+    except ExampleScrapeError as e:
+        return cpu_pool.completed(ExampleFailure(str(e)))
+    except (requests.RequestException, ValueError) as e:
+        logging.error("Fetching examples for " + word + " from Naver failed: " + str(e))
+        return cpu_pool.completed(ExampleFailure("No examples found for that word_to_process. Naver returned an "
+                                                 "error."))
+
+    if cache is not None:
+        cache.put("naver", cache_query, json.dumps(examples))
+
+    return cpu_pool.submit(rendering.render_examples, examples)
+
+
+def get_journaled_examples_html(journal, word, **kwargs):
+    """
+    Gets a word's examples through the journal and waits for them to be rendered. See submit_journaled_examples_html.
+
+    :return: Returns the rendered examples
+    :rtype: str
+    """
+    return submit_journaled_examples_html(journal, word, **kwargs).result()
+
+
+def submit_journaled_examples_html(journal, word, **kwargs):
+    """
+    Wraps submit_examples_html so that examples already rendered in the journal are reused and new ones are recorded
+    once they have been rendered
+
+    :param checkpoint_journal.CheckpointJournal journal: The run's journal. May be None.
+    :param dict word: The word's entry as returned by process_word
+    :param kwargs: Passed through to submit_examples_html
+    :return: Returns a future for the rendered examples
+    :rtype: concurrent.futures.Future
+    """
+
+    if journal is not None:
+        examples_html = journal.completed_examples(examples_key(word))
+        if examples_html is not None:
+            logging.debug("Examples for " + word["final_traditional"] + " were already in the journal.")
+            return cpu_pool.completed(examples_html)
+
+    rendered = submit_examples_html(word["simplified"], word["pinyin"], **kwargs)
+
+    def record(future):
+        # Failures aren't finished work. Leaving them out of the journal means --resume asks Naver again.
+        if future.exception() is None and not isinstance(future.result(), ExampleFailure):
+            journal.record_examples(examples_key(word), future.result())
+
+    if journal is not None:
+        rendered.add_done_callback(record)
+
+    return rendered
 
 
 def query_yes_no(question, default="yes"):
@@ -223,7 +386,70 @@ def query_yes_no(question, default="yes"):
                              "(or 'y' or 'n').\n")
 
 
-def output_combined(output_file_name, word_list, delimiter, thread_count, show_chrome=False):
+def card_fields(word, examples_html, media=None):
+    """
+    :param dict word: The word's entry as returned by process_word
+    :param str examples_html: The rendered examples for the word, as returned by get_examples_html, or None if there
+                              aren't any
+    :param character_media.CharacterMedia media: If provided, each character's hanzicraft block and history are
+                                                 saved as shared media and the fields only include them
+    :return: Returns the card's fields in the order of the "Chinese Words Updated" mapping: Traditional, Simplified,
+             Pinyin, Meaning, Tags, History and Characters, which is followed by the examples
+    :rtype: list
+    """
+
+    if examples_html is None:
+        logging.debug("No examples found for word_to_process: " + word["final_traditional"])
+        examples_html = ""
+
+    characters = [character.replace('\n', "") for character in word["characters"]]
+    history = word["history"]
+
+    if media is not None:
+        characters = [media.reference(character) for character in characters]
+        # Entries journaled before history_parts existed are stored as one block
+        for part in word.get("history_parts", [history]):
+            history = history.replace(part, media.reference(part), 1)
+
+    return [word["final_traditional"], word["simplified"], word["pinyin"], "<br>".join(word["defs"]),
+            word["hsk"].replace(" ", ""), history, "".join(characters) + examples_html]
+
+
+def format_card(word, examples_html, delimiter, media=None):
+    """
+    Builds the line written to the flashcard file for a single word
+
+    :param dict word: The word's entry as returned by process_word
+    :param str examples_html: The rendered examples for the word, as returned by get_examples_html, or None if there
+                              aren't any
+    :param str delimiter: The delimiter you want to use for your flashcards
+    :param character_media.CharacterMedia media: See card_fields
+    :return: Returns the line for the card, including the trailing newline
+    :rtype: str
+    """
+    return delimiter.join(field.replace(delimiter, "") for field in card_fields(word, examples_html, media)) + "\n"
+
+
+def add_note(package, word, examples_html, media=None):
+    """
+    Adds a word to an Anki package. Tags are kept on the note rather than in a field.
+
+    :param anki_package.AnkiPackage package: The package being written
+    :param dict word: The word's entry as returned by process_word
+    :param str examples_html: The rendered examples for the word or None if there aren't any
+    :param character_media.CharacterMedia media: See card_fields
+    :return: Returns nothing
+    """
+    fields = card_fields(word, examples_html, media)
+    package.add_note(fields[:4] + fields[5:], tags=fields[4])
+
+
+def output_combined(output_file_name, word_list, delimiter, thread_count, show_chrome=False,
+                    driver_max_uses=DEFAULT_MAX_USES, example_backend="http",
+                    naver_api_url=naver_examples.NAVER_EXAMPLE_API, stream=False, reorder_window=None,
+                    flush_interval=50, journal=None, naver_prefetch=naver_examples.DEFAULT_PREFETCH,
+                    output_format="text", deck_name=anki_package.DEFAULT_DECK_NAME,
+                    shared_characters=False, media_dir=None, card_lines=None):
     """
     Allows you to output flashcards with both the word_to_process and the character embedded in them.
 
@@ -232,105 +458,262 @@ def output_combined(output_file_name, word_list, delimiter, thread_count, show_c
     :param str delimiter: The delimiter you want to use for your flashcards
     :param int thread_count: The number of threads that will be used to pull examples
     :param bool show_chrome: Used to control whether the chrome browsers will appear or not
+    :param int driver_max_uses: How many words a pooled browser handles before it is replaced with a fresh one
+    :param str example_backend: Either http or selenium. See submit_examples_html.
+    :param str naver_api_url: The Naver JSON endpoint used by the http example backend
+    :param bool stream: Write each card as soon as its examples, and those of every word before it, are ready instead
+                        of waiting for all of the examples first
+    :param int reorder_window: When streaming, the most words whose examples may be in flight or waiting to be
+                               written at once. Defaults to four times thread_count.
+    :param int flush_interval: When streaming, the output file is flushed every this many cards
+    :param checkpoint_journal.CheckpointJournal journal: If provided, examples already in the journal are reused and
+                                                         each newly rendered example is recorded in it
+    :param int naver_prefetch: The most example pages fetched at once for each word by the http example backend
+    :param str output_format: text writes a delimited file for Anki's text import. apkg writes an Anki package.
+    :param str deck_name: With the apkg format, the name of the deck the cards go in
+    :param bool shared_characters: Write the character HTML shared between cards once, as media, instead of copying
+                                   it into every card. See character_media.
+    :param str media_dir: With shared_characters and the text format, the Anki media folder the shared character
+                          HTML is written to. With the apkg format it goes in the package.
+    :param list card_lines: With the text format, instead of writing output_file_name, append a tuple of (word, its
+                            rendered examples, its card's line) to this list for each word, in the order of word_list
     :return: Returns nothing
     """
 
-    with open(output_file_name, 'w', encoding="utf-8-sig") as output_file:
+    media = None
 
-        examples = {}
+    if output_format == "apkg":
+        output_file = anki_package.AnkiPackage(output_file_name, deck_name)
 
-        logging.info("Launching threads to get example text.")
+        if shared_characters:
+            media = CharacterMedia(output_file.add_media)
 
-        # Here we use threading to launch multiple threads to get the examples at the same time so this doesn't take
-        # forever.
-        with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        def write_card(word, examples_html):
+            add_note(output_file, word, examples_html, media)
+    else:
+        # With card_lines nothing is written. The StringIO only stands in for the file.
+        output_file = open(output_file_name, 'w', encoding="utf-8-sig") if card_lines is None else io.StringIO()
 
-            future_example = {executor.submit(get_examples_html, word["simplified"], word["pinyin"], is_server=False,
-                                              show_chrome=show_chrome): word for word in word_list}
+        if shared_characters:
+            media = CharacterMedia(character_media.media_folder_saver(media_dir))
 
-            length = str(len(word_list))
-            i = 1
+        def write_card(word, examples_html):
+            card = format_card(word, examples_html, delimiter, media)
+            if card_lines is None:
+                output_file.write(card)
+            else:
+                card_lines.append((word, examples_html, card))
+
+    with output_file:
+
+        logging.info("Launching threads to get example text.")
+
+        # Here we use threading to launch multiple threads to get the examples at the same time so this doesn't take
+        # forever. With the selenium backend each worker borrows a long lived browser from the pool rather than
+        # starting and quitting its own. The pool only starts browsers when they are asked for so it costs nothing
+        # with the http backend.
+        example_drivers = DriverPool(lambda: create_driver(headless=not show_chrome), thread_count,
+                                     max_uses=driver_max_uses)
+
+        if example_backend == "http":
+            # Size the shared connection and page pools to match the number of pages in flight at once
+            naver_examples.get_session(pool_size=thread_count * naver_prefetch)
+            naver_examples.get_page_executor(workers=thread_count * naver_prefetch)
+
+        # The worker thread is free for the next word as soon as the examples are fetched. Rendering finishes in the
+        # CPU stage and the future we hand back only completes once it has.
+        def submit(executor, word):
+            return cpu_pool.flatten(executor.submit(submit_journaled_examples_html, journal, word, is_server=False,
+                                                    show_chrome=show_chrome, driver_pool=example_drivers,
+                                                    backend=example_backend, naver_api_url=naver_api_url,
+                                                    naver_prefetch=naver_prefetch))
+
+        length = str(len(word_list))
 
-            for future in concurrent.futures.as_completed(future_example):
-                word_processed = future_example[future]
-                logging.info("We have processed " + str(i) + " of " + length + " examples.")
-                try:
-                    if word_processed is not None:
-                        examples[word_processed["final_traditional"]] = future.result()
+        try:
+            with ThreadPoolExecutor(max_workers=thread_count) as executor:
+
+                if stream:
+                    _write_streaming(output_file, word_list, write_card, lambda word: submit(executor, word),
+                                     reorder_window or thread_count * 4, flush_interval)
+                    return
+
+                examples = {}
+
+                future_example = {submit(executor, word): word for word in word_list}
+
+                i = 1
+
+                for future in concurrent.futures.as_completed(future_example):
+                    word_processed = future_example[future]
+                    logging.info("We have processed " + str(i) + " of " + length + " examples.")
+                    try:
+                        if word_processed is not None:
+                            examples[word_processed["final_traditional"]] = future.result()
+                        else:
+                            logging.info("No examples found for word_to_process: " +
+                                         word_processed["final_traditional"])
+                    except Exception as exc:
+                        logging.error('%r generated an exception: %s' % (word_processed["final_traditional"], exc))
                     else:
-                        logging.info("No examples found for word_to_process: " + word_processed["final_traditional"])
-                except Exception as exc:
-                    logging.error('%r generated an exception: %s' % (word_processed["final_traditional"], exc))
-                else:
-                    logging.info('Finished processing word_to_process %s' % word_processed["final_traditional"])
+                        logging.info('Finished processing word_to_process %s' % word_processed["final_traditional"])
 
-                i = i + 1
+                    i = i + 1
+        finally:
+            # Quit the pooled browsers even if something above blew up so we don't leave Chrome processes behind.
+            example_drivers.close()
 
         logging.info("Finished getting all examples.")
 
         logging.info("Writing words.")
         for word in word_list:
-
             logging.info("Outputting " + word["final_traditional"])
-            output_file.write(word["final_traditional"] + delimiter + word["simplified"] + delimiter + word["pinyin"] +
-                              delimiter + "<br>".join(word["defs"]).replace(delimiter, "") +
-                              delimiter + word["hsk"].replace(" ", "") + delimiter +
-                              word["history"].replace(delimiter, "") + delimiter)
+            write_card(word, examples.get(word["final_traditional"]))
 
-            for character in word["characters"]:
-                output_file.write(character.replace('\n', "").replace(delimiter, ""))
 
-            try:
-                line = examples[word["final_traditional"]].replace('\n', "") + "\n"
-            except KeyError:
-                logging.debug("No examples found for word_to_process: " + word["final_traditional"])
-            i = i + 1
-
-            output_file.write(line.replace(delimiter, ""))
-
-        # TODO - this is a hack. See https://github.com/grantcurell/chinese_word_maker/issues/1
-        if name == 'nt':
-            logging.info("Killing lingering chromedriver processes.")
-            subprocess.run(["taskkill", "/F", "/IM", "chromedriver.exe"])
-            logging.info("Killing lingering chrome processes.")
-            subprocess.run(["taskkill", "/F", "/IM", "chrome.exe"])
-            exit(0)
+def _write_streaming(output_file, word_list, write_card, submit, reorder_window, flush_interval):
+    """
+    Writes cards in input order as their examples finish. At most reorder_window words are in flight or finished and
+    waiting on an earlier word at any one time so memory stays bounded no matter how big the deck is. Each card is
+    written in one piece so if we die part way through the file holds a valid, if partial, deck.
+
+    :param output_file: The open flashcard file or anki_package.AnkiPackage
+    :param list word_list: The list of words we want to write to file
+    :param write_card: A function which takes a word and its rendered examples and writes its card
+    :param submit: A function which takes a word and returns a future for its rendered examples
+    :param int reorder_window: The most words allowed in flight at once
+    :param int flush_interval: The output file is flushed every this many cards
+    :return: Returns nothing
+    """
+
+    length = str(len(word_list))
+    pending = deque()  # type: deque
+    remaining = iter(word_list)
 
+    for word in islice(remaining, reorder_window):
+        pending.append((word, submit(word)))
 
-def get_words(words, skip_choices=False, ask_if_match_not_found=True, combine_exact_defs=False, preference_hsk=False):
+    i = 0
+    while pending:
+        word, future = pending.popleft()
+
+        try:
+            examples_html = future.result()
+        except Exception as exc:
+            logging.error('%r generated an exception: %s' % (word["final_traditional"], exc))
+            examples_html = None
+
+        write_card(word, examples_html)
+        i = i + 1
+        logging.info("We have written " + str(i) + " of " + length + " cards.")
+
+        if i % flush_interval == 0:
+            output_file.flush()
+
+        # Keep the window full
+        for next_word in islice(remaining, 1):
+            pending.append((next_word, submit(next_word)))
+
+    output_file.flush()
+
+
+def continue_after_exception():
+    """
+    Because you could spend a lot of time working on this we want to avoid program termination at all costs. Called
+    from a bare except, this prints the exception and gives the option to continue or not.
+
+    :return: Returns nothing. Exits if the user doesn't want to continue.
+    """
+    traceback.print_exc()
+    logging.error("Uh oh. We've run into a problem, but we're trying to stop the program from terminating "
+                  "on you!")
+    if not query_yes_no(
+            "We have caught an unknown exception but prevented the program from terminating. "
+            "Do you want to continue with the next word_to_process?"):
+        exit(1)
+
+
+def split_word_line(line):
+    """
+    Splits a line of the input file. A line is a word, optionally followed by a tab and its numbered pinyin, like the
+    新的單詞 exports. Anything after the pinyin is ignored.
+
+    :param str line: Ex: 瞬間\tshun4jian1
+    :return: Returns a tuple of the word and its pinyin, or None if the line doesn't have any. Ex: ("瞬間", "shun4jian1")
+    :rtype: tuple
+    """
+    fields = line.strip().split("\t")
+    word_pinyin = fields[1].strip() if len(fields) > 1 else ""
+    return fields[0].strip(), word_pinyin or None
+
+
+def get_words(words, skip_choices=False, ask_if_match_not_found=True, combine_exact_defs=False, preference_hsk=False,
+              lookup_concurrency=8, journal=None, group_by_word=False):
     """
     Reaches out to www.mdbg.net and grabs the data for each of the words on which you want data
 
-    :param list words: The list of the words you want to add
+    :param list words: The list of the words you want to add. Each may be followed by a tab and its numbered pinyin
+                       in which case the entry with that pinyin is chosen without asking. See split_word_line.
     :param bool skip_choices: Whether you want to skip selection of the different possible options. The closest match
                               will be selected instead.
     :param bool ask_if_match_not_found: The program will first try to skip all choices, but if it can't find a match
                                          it will ask.
     :param bool combine_exact_defs: Used if you want to just return a definition for everything with an exact match.
     :param bool preference_hsk: Used as a tiebreaker if there are multiple matches. Selects the one which is an HSK word_to_process
+    :param int lookup_concurrency: The number of MDBG lookups allowed in flight at the same time
+    :param checkpoint_journal.CheckpointJournal journal: If provided, words already in the journal are not looked up
+                                                         again. Each word's selection is recorded in it as soon as
+                                                         it is made and the word again once it is finished.
+    :param bool group_by_word: Return a list of (word, its entries) tuples, one for each word that was processed
+                               without an error, instead of one flat list of entries
     :return: Returns two lists, one with the words found and the other with the characters found
     :rtype: list
     """
 
     new_words = []  # type: list
+    grouped_words = []  # type: list
+
+    words = [word.strip() for word in words]
 
     length = str(len(words))
     i = 1
 
-    for word in words:
+    # Fetch and parse the MDBG results for many words at once. Selection, which may prompt, only starts once all of
+    # the lookups are done so the prompts never hold up the network work. Results are consumed in input order.
+    logging.info("Looking up " + length + " words on MDBG with up to " + str(lookup_concurrency) + " at a time.")
+    with ThreadPoolExecutor(max_workers=lookup_concurrency) as executor:
+        lookups = [None if journal is not None and (journal.completed_word(word) is not None or
+                                                    journal.selected_word(word) is not None)
+                   else cpu_pool.flatten(executor.submit(submit_word_entries, split_word_line(word)[0]))
+                   for word in words]
+
+    # Each item is (word, the entries selected for it, whether they came out of the journal already enriched)
+    selections = []  # type: list
+
+    for word, lookup in zip(words, lookups):
 
         logging.info("Processing word_to_process " + str(i) + " of " + length)
         i = i + 1
 
         try:
-            word = word.strip()  # type: str
+            if lookup is None and journal.completed_word(word) is not None:
+                logging.debug(word + " was already in the journal.")
+                selections.append((word, journal.completed_word(word), True))
+            elif lookup is None:
+                logging.debug("The entries for " + word + " were already chosen. Finishing them off.")
+                selections.append((word, journal.selected_word(word), False))
+            else:
+                word_only, word_pinyin = split_word_line(word)
+                word_entries = process_word(word_only, skip_choices=skip_choices,
+                                            ask_if_match_not_found=ask_if_match_not_found,
+                                            combine_exact_defs=combine_exact_defs, preference_hsk=preference_hsk,
+                                            entries=lookup.result(), enrich=False, word_pinyin=word_pinyin)
+
+                # Journaled straight away so the choice survives anything that goes wrong before the word is finished
+                if journal is not None:
+                    journal.record_selection(word, word_entries)
 
-            for word_entry in process_word(word, skip_choices=skip_choices,
-                                           ask_if_match_not_found=ask_if_match_not_found,
-                                           combine_exact_defs=combine_exact_defs,
-                                           preference_hsk=preference_hsk):
-                if word_entry:
-                    new_words.append(word_entry)
+                selections.append((word, word_entries, False))
 
         except KeyboardInterrupt:
             if query_yes_no("You have pressed ctrl+C. Are you sure you want to exit?"):
@@ -339,76 +722,110 @@ def get_words(words, skip_choices=False, ask_if_match_not_found=True, combine_ex
             logging.error("It looks like we've caught an attribute error. Maybe there's an invalid character "
                           "in the input? Error is: " + str(e))
             return None
-        # Because you could spend a lot of time working on this we want to avoid program termination at all costs
-        # Because of this we catch all exceptions and provide the option to continue or not.
         except:
-            traceback.print_exc()
-            logging.error("Uh oh. We've run into a problem, but we're trying to stop the program from terminating "
-                          "on you!")
-            if not query_yes_no(
-                    "We have caught an unknown exception but prevented the program from terminating. "
-                    "Do you want to continue with the next word_to_process?"):
-                exit(1)
+            continue_after_exception()
 
-    if len(new_words) < 1:
-        new_words = None
+    # Now that we know every entry we are keeping, resolve the history of all of their characters together so that
+    # each unique character costs at most one request.
+    if history_client is not None:
+        try:
+            history_client.prefetch(character for word, word_entries, journaled in selections if not journaled
+                                    for entry in word_entries for character in entry["traditional"])
+        except KeyboardInterrupt:
+            if query_yes_no("You have pressed ctrl+C. Are you sure you want to exit?"):
+                exit(0)
+        except:
+            continue_after_exception()
 
-    return new_words
+    def enrich_entries(entries_to_enrich):
+        for entry_to_enrich in entries_to_enrich:
+            enrich_word_entry(entry_to_enrich)
 
+    # Enrichment is spread over several threads. The hanzicraft registry makes sure that words sharing characters
+    # don't load the same page twice. Results are still consumed, and journaled, in input order.
+    with ThreadPoolExecutor(max_workers=lookup_concurrency) as executor:
+        enrichments = [None if journaled else executor.submit(enrich_entries, word_entries)
+                       for word, word_entries, journaled in selections]
 
-def process_word_entry(entry):
-    """
-    Processes a single row from www.mbdg.net and returns it in a dictionary
+        for (word, word_entries, journaled), enrichment in zip(selections, enrichments):
 
-    :param bs4.element.Tag entry: This is equivalent to one row in the results from www.mdbg.net
-    :return: Returns a list of dictionary items containing each of the possible results
-    :rtype: list of dicts
-    """
+            try:
+                if enrichment is not None:
+                    enrichment.result()
 
-    organized_entry = {"characters": []}  # type: dict
+                    # A word missing some of its history isn't finished. Its selection is already journaled so
+                    # --resume only has to fill the rest in.
+                    if any(word_entry.get("history_failed") for word_entry in word_entries if word_entry):
+                        logging.warning("Some of the history for " + word + " couldn't be fetched. It will be "
+                                        "fetched again with --resume.")
+                    elif journal is not None:
+                        journal.record_word(word, word_entries)
 
-    organized_entry. \
-        update({"traditional": entry.find("td", {"class": "head"}).find("div", {"class": "hanzi"}).text})
+                grouped_words.append((word, [word_entry for word_entry in word_entries if word_entry]))
 
-    # I didn't investigate why, but for some reason the site was adding u200b so I just manually stripped that
-    # whitespace out.
-    organized_entry. \
-        update({"pinyin": str(entry.find("div", {"class": "pinyin"}).text).lower().strip().replace(u'\u200b', "")})
+                for word_entry in word_entries:
+                    if word_entry:
+                        new_words.append(word_entry)
 
-    # The entries come separated by /'s which is why we have the split here
-    # The map function here just gets rid of the extra whitespace on each word_to_process before assignment
-    organized_entry. \
-        update({"defs": list(map(str.strip, str(entry.find("div", {"class": "defs"}).text).split('/')))})
+            except KeyboardInterrupt:
+                if query_yes_no("You have pressed ctrl+C. Are you sure you want to exit?"):
+                    exit(0)
+            except:
+                continue_after_exception()
 
-    tail = entry.find("td", {"class": "tail"})
-    simplified = tail.find("div", {"class": "hanzi"})  # type: bs4.element.Tag
-    hsk = tail.find("div", {"class": "hsk"})  # type: bs4.element.Tag
+    if group_by_word:
+        return grouped_words
 
-    character_string = ""
+    if len(new_words) < 1:
+        new_words = None
 
-    if simplified is not None:
-        organized_entry.update({"simplified": simplified.text})
+    return new_words
 
-        for i, character in enumerate(organized_entry["traditional"], start=0):
 
-            if character == organized_entry["simplified"][i]:
-                character_string = character_string + character
-            else:
-                character_string = character_string + character + organized_entry["simplified"][i]
-    else:
-        organized_entry.update({"simplified": ""})
-        character_string = organized_entry["traditional"]
+def lookup_history(character):
+    """
+    Asks the character server at --api-address for the history of a single character
+
+    :param str character: The character to look up
+    :return: Returns the explanation of the character or None if the server doesn't know it
+    :rtype: str
+    :raises history_client.HistoryUnavailable: If the server couldn't be asked
+    """
+    return history_client.lookup(character)
+
+
+def enrich_word_entry(organized_entry):
+    """
+    Adds the character history and the hanzicraft character breakdown to an entry produced by
+    html_parsing.parse_word_entry. Each call costs one browser page load and one API call per unique character so
+    this should only be run on entries that survived selection. Calling it a second time on the same entry does
+    nothing. If the history of a character couldn't be fetched the entry is still filled in, without it, and
+    history_failed is set on it so the word isn't treated as finished.
+
+    :param dict organized_entry: An entry as returned by html_parsing.parse_word_entry
+    :return: Returns the same dictionary with the history and characters fields filled in
+    :rtype: dict
+    """
+
+    if "history" in organized_entry:
+        return organized_entry
 
     organized_entry["history"] = ""
+    # Each character's explanation on its own so --character-media can store them separately
+    organized_entry["history_parts"] = []
 
     for i, character in enumerate("".join(dict.fromkeys(organized_entry["traditional"]))):
-        r = requests.put("http://" + args.api_address + "/api/lookup",
-                         data=json.dumps({"characters_to_lookup": character}),
-                         headers={'Content-Type': 'application/json'})
+        try:
+            explanation = lookup_history(character)
+        except HistoryUnavailable:
+            organized_entry["history_failed"] = True
+            explanation = None
 
-        if r.status_code != 404:
+        if explanation is not None:
             history = re.sub("([\u4e00-\u9FFF])", "<a href=\"http://charserver.lan:4200/\\1\">\\1</a>",
-                             r.json()[0]["explanation"])
+                             explanation)
+
+            organized_entry["history_parts"].append(history)
 
             if i == 0:
                 organized_entry["history"] = organized_entry["history"] + history
@@ -418,61 +835,84 @@ def process_word_entry(entry):
             organized_entry["history"] = ""
 
     # Get words from hanzicraft
-    url_string = "https://hanzicraft.com/character/" + quote("".join(dict.fromkeys(character)))  # type: str
+    hanzicraft_query = "".join(dict.fromkeys(character))  # type: str
+    organized_entry["characters"].append(hanzicraft_registry.get(hanzicraft_query))
 
-    driver.get(url_string)  # type: str
+    return organized_entry
 
-    soup = BeautifulSoup(driver.page_source, 'html.parser').find(id="display")  # type: bs4.BeautifulSoup
 
-    for favorite_button in soup.find_all('button', id="addfav"):
-        favorite_button.decompose()
+def fetch_hanzicraft_page(characters):
+    """
+    Gets the raw hanzicraft page for some characters, from the cache if we can, otherwise by loading it in one of
+    the pooled browsers or, with --hanzicraft-backend http, with a plain HTTP request
 
-    for character_nav in soup.find_all('div', {"class": "character-nav"}):
-        character_nav.decompose()
+    :param str characters: The characters to look up
+    :return: Returns the page source
+    :rtype: str
+    """
 
-    for index, word_block in enumerate(soup.find_all('div', {"class": "wordblock"})):
-        if index > 4:
-            word_block.decompose()
+    url_string = args.hanzicraft_url + quote(characters)  # type: str
 
-    # If there are no examples then delete the example words block so it doesn't consume space
-    if not soup.find_all('div', {"class": "wordblock"}):
-        for example in soup.find_all('div', {"class": "examples"}):
-            example.decompose()
+    def fetch():
+        with metrics.stage("hanzicraft_fetch"):
+            if args.hanzicraft_backend == "http":
+                return hanzicraft.fetch_page_over_http(url_string)
 
-    for a in soup.findAll('a'):
+            with hanzicraft_drivers.checkout() as hanzicraft_driver:
+                request_scheduler.call("hanzicraft", hanzicraft_driver.get, url_string)
+                page_source = hanzicraft_driver.page_source
 
-        if "href" in a.attrs:
-            # If the character reference is actually a word_to_process, send us to mdbg instead
-            if "character" in a['href'] and len(a['href'].replace('/character/', "")) > 1:
-                a['href'] = "https://www.mdbg.net/chinese/dictionary?page=worddict&wdrst=1&wdqb=" + \
-                            a['href'].split('/')[2]
-            else:
-                # The links start is relative. We want them to be FQDNs so they reach out to Hanzicraft
-                a['href'] = "https://hanzicraft.com" + a['href']
+        if metrics.enabled:
+            metrics.increment("hanzicraft_bytes", len(page_source.encode('utf-8')))
+        return page_source
 
-            # Remove target because it causes the links to fail.
-            if "target" in a.attrs:
-                a.attrs.pop("target")
+    # The http backend gets the raw page and Selenium the rendered one so they are cached separately
+    return cached_fetch("hanzicraft", args.hanzicraft_backend + " " + url_string, fetch)
 
-    organized_entry["characters"].append(str(soup))
 
-    for i, character in enumerate(organized_entry["characters"], start=0):
-        organized_entry["characters"][i] = htmlmin.minify(character, remove_empty_space=True, remove_comments=True,
-                                                          remove_optional_attribute_quotes=True)
+def fetch_word_entries(word_to_process):
+    """
+    Looks a word up and waits for the results to be parsed. See submit_word_entries.
 
-    if hsk is not None:
-        organized_entry.update({"hsk": hsk.text})
-    else:
-        organized_entry.update({"hsk": ""})
+    :param str word_to_process: The word from the list
+    :return: Returns a list of entries as produced by html_parsing.parse_word_entry
+    :rtype: list of dicts
+    """
+    return submit_word_entries(word_to_process).result()
 
-    if organized_entry["simplified"].strip() == "":
-        organized_entry["simplified"] = HanziConv.toSimplified(organized_entry["traditional"])
 
-    return organized_entry
+def submit_word_entries(word_to_process):
+    """
+    Looks a word up on www.mdbg.net and hands the page to the CPU stage to parse every row that comes back. This does
+    no selection and never prompts so it is safe to run for many words at once from worker threads. If the offline
+    CC-CEDICT dictionary is in use the lookup is answered from it instead.
+
+    :param str word_to_process: The word from the list
+    :return: Returns a future for a list of entries as produced by html_parsing.parse_word_entry
+    :rtype: concurrent.futures.Future
+    """
+
+    if dictionary is not None:
+        return cpu_pool.completed(dictionary.lookup(word_to_process))
+
+    logging.debug("URL is: " + args.mdbg_url + word_to_process)
+
+    url_string = args.mdbg_url + quote(word_to_process)  # type: str
+
+    def fetch():
+        with metrics.stage("mdbg_fetch"):
+            page = request_scheduler.call("mdbg", lambda: urlopen(url_string, timeout=MDBG_TIMEOUT).read())
+        metrics.increment("mdbg_bytes", len(page))
+        return page.decode('utf-8')
+
+    html = cached_fetch("mdbg", url_string, fetch)  # type: str
+
+    with metrics.stage("mdbg_parse"):
+        return cpu_pool.submit(html_parsing.parse_mdbg_entries, html)
 
 
 def process_word(word_to_process, skip_choices=False, ask_if_match_not_found=True, skip_if_not_exact=True,
-                 combine_exact_defs=False, preference_hsk=False):
+                 combine_exact_defs=False, preference_hsk=False, entries=None, enrich=True, word_pinyin=None):
     """
     Processes a word in the list of words
 
@@ -484,34 +924,40 @@ def process_word(word_to_process, skip_choices=False, ask_if_match_not_found=Tru
     :param bool skip_if_not_exact: Skip if an exact match isn't found.
     :param bool combine_exact_defs: Used if you want to just return a definition for everything with an exact match.
     :param bool preference_hsk: Used as a tiebreaker if there are multiple matches. Selects the one which is an HSK word
+    :param list entries: The entries for the word as returned by fetch_word_entries. If they aren't provided they are
+                         fetched here.
+    :param bool enrich: Whether to run enrich_word_entry on the selected entries. Turned off by get_words so it can
+                        look up the history of every selected character together first.
+    :param str word_pinyin: The word's pinyin, numbered or tone marked, if we know it. The entries with that reading
+                            are chosen without any of the matching below and without prompting. If none of them have
+                            it we carry on as if it hadn't been given.
     :return: Returns a dictionary containing the word's entry
     :rtype: dict
     """
 
     logging.info("Requested word_to_process is: " + word_to_process)
 
-    logging.debug("URL is: https://www.mdbg.net/chinese/dictionary?page=worddict&wdrst=1&wdqb=" + word_to_process)
+    if entries is None:
+        entries = fetch_word_entries(word_to_process)
 
-    url_string = "https://www.mdbg.net/chinese/dictionary?page=worddict&wdrst=1&wdqb=" \
-                 + quote(word_to_process)  # type: str
+    if word_pinyin:
+        entry_list = select_by_pinyin(word_to_process, word_pinyin, entries, combine_exact_defs)
 
-    html = urlopen(url_string).read().decode('utf-8')  # type: str
+        if entry_list:
+            return keep_entries(entry_list, enrich)
 
-    soup = BeautifulSoup(html, 'html.parser')  # type: bs4.BeautifulSoup
+        logging.info("None of the entries for " + word_to_process + " are read " + word_pinyin + ". Choosing the "
+                     "usual way.")
 
     entry_list = []  # Used to return the entries we found.
 
-    entries = []
-    for entry in soup.find_all("tr", {"class": "row"}):
-        entries.append(process_word_entry(entry))
-
     match_not_found = False
     definition = ""
     simplified_word = ""
 
     if skip_choices:
         # We use the simplified to avoid the one to many problem.
-        simplified_word = HanziConv.toSimplified(word_to_process)
+        simplified_word = conversion.to_simplified(word_to_process)
 
         selection = 0
         exact_match = False
@@ -648,139 +1094,557 @@ def process_word(word_to_process, skip_choices=False, ask_if_match_not_found=Tru
                     entry_list.append(entries[selection - 1])
 
     if selection != 0:
-        if len(entry_list) > 1:
-            for index, entry in enumerate(entry_list):
-                entry["final_traditional"] = "(" + str(index + 1) + ") " + entry["traditional"]
-        else:
-            entry_list[0]["final_traditional"] = entry_list[0]["traditional"]
-        return entry_list
+        return keep_entries(entry_list, enrich)
     else:
         return []
 
 
-parser = ArgumentParser(description="Used to create Anki flash cards based on data from the website www.mdbg.net")
-parser.add_argument('--file', metavar='FILE', dest="input_file_name", type=str, required=False,
-                    help='The path to a newline delimited list of Chinese words or characters in Hanji The default'
-                         'is new_words.txt', default="input.txt")
-parser.add_argument('--words-output-file', metavar='WORDS-OUTPUT-FILE', dest="words_output_file_name", type=str,
-                    required=False, default="word_list.txt",
-                    help='By default this is word_list.txt. You may change it by providing this argument.')
-parser.add_argument('--skip-choices', dest="skip_choices", required=False, action='store_true', default=False,
-                    help='This option will tell the program to just select the closest match for the word_to_process.')
-parser.add_argument('--ask-if-match-not-found', dest="ask_if_match_not_found", required=False, action='store_true',
-                    default=False, help='Will only ask for input if an exact match between the pinyin and a '
-                                        'character isn\'t found.')
-parser.add_argument('--combine-exact', dest="combine_exact", required=False, action='store_true',
-                    default=False, help='Will instruct the program to automatically store all definitions matched'
-                                        ' in MDBG.')
-parser.add_argument('--preference-hsk', dest="preference_hsk", required=False, action='store_true',
-                    default=False,
-                    help='Uses whether a word_to_process is from HSK vocab as a tiebreaker between multiple'
-                         ' matching words. Discards non-HSK words.')
-parser.add_argument('--resume', dest="resume", required=False, action='store_true', default=False,
-                    help='After word_to_process creation a file called ~temp will be created. Using the same syntax you did'
-                         ' to originally run the program, you can add --resume if for some reason the program'
-                         ' failed during example creation.')
-parser.add_argument('--log-level', metavar='LOG_LEVEL', dest="log_level", required=False, type=str, default="info",
-                    choices=['debug', 'info', 'warning', 'error', 'critical'],
-                    help='A path to Chinese Blockbuster in EPUB format. In my case, I bought all of them and merged'
-                         ' them into one big book.')
-parser.add_argument('--delimiter', metavar='DELIMITER', dest="delimiter", required=False, type=str, default="\\",
-                    help='Allows you to optionally select the delimiter you use for the delimiter in your Anki'
-                         'cards. By default it is ~ which should avoid colliding with anything.')
-parser.add_argument('--anki-username', metavar='ANKI_USERNAME', dest="anki_username", required=False, type=str,
-                    default="User 1", help='Your Anki username.')
-parser.add_argument('--run-server', dest="run_server", required=False, action='store_true', default=False,
-                    help='Instead of writing out flashcards, we will start a flask server where you can query '
-                         'for characters. This will supersede all other arguments.')
-parser.add_argument('--port', dest="port", required=False, type=int, default=5000,
-                    help='Specify the port you want Flask to run on')
-parser.add_argument('--thread-count', dest="thread_count", required=False, type=int, default=5,
-                    help='Specify the number of worker threads with which you want to grab examples.')
-parser.add_argument('--show-chrome', dest="show_chrome", required=False, action='store_true',
-                    help='Will disable headless mode on Chromedriver and cause the browser to pop up')
-parser.add_argument('--api-address', dest="api_address", required=False, default="127.0.0.1:5000", help="The API "
-                    "address of the character server used to look up history.")
-parser.add_argument('--print-usage', dest="print_usage", required=False, action='store_true',
-                    help='Show example usage.')
-parser.add_argument('--show-usage', dest="print_usage", required=False, action='store_true',
-                    help='Show example usage.')
-
-args = parser.parse_args()
-
-if not args.run_server and not args.input_file_name and not args.print_usage:
-    parser.print_help()
-    exit(0)
-
-if args.print_usage:
-    print('python chinese_flashcard_maker.py --anki-username "User 1" --file input.txt --skip-choices --show-chrome --delimiter \ --combine-exact --preference-hsk --api-address 192.168.1.83:5000')
-    print('\nVisual Studio Code regex for excluding lines starting with asterisk: ^(?!\*).*\\n')
-    print('\nMapping for "Chinese Words Updated" is:')
-    print('Traditional\nSimplified\nPinyin\nMeaning\nTags\nHistory\nCharacters')
-    exit(0)
-
-if args.ask_if_match_not_found:
-    args.skip_choices = True
-
-if 'Windows' in platform.system():
-    image_path = path.join(getenv("APPDATA"), "Anki2", args.anki_username, "collection.media")
-else:
-    logging.error("Only works on Windows with Anki installed!")
-    exit(0)
-
-if args.log_level:
-    if args.log_level == "debug":
-        logging.basicConfig(level=logging.DEBUG)
-    elif args.log_level == "info":
-        logging.basicConfig(level=logging.INFO)
-    elif args.log_level == "warning":
-        logging.basicConfig(level=logging.WARNING)
-    elif args.log_level == "error":
-        logging.basicConfig(level=logging.ERROR)
-    elif args.log_level == "critical":
-        logging.basicConfig(level=logging.CRITICAL)
-else:
-    logging.basicConfig(level=logging.INFO)
-
-if not args.delimiter:
-    args.delimiter = "\\"
-else:
-    args.delimiter = args.delimiter.strip('\'').strip('\"')
-
-driver = create_driver(headless=False)
-
-if args.input_file_name and not args.resume:
-    if Path(args.input_file_name).is_file():
-        words = []
-        with open(args.input_file_name, encoding="utf-8-sig") as input_file:
-            for word in input_file.readlines():
-                if word.strip() != "":
-                    words.append(word)
-
-        words = get_words(words, skip_choices=args.skip_choices,
-                          ask_if_match_not_found=args.ask_if_match_not_found,
-                          combine_exact_defs=args.combine_exact,
-                          preference_hsk=args.preference_hsk)
-
-        # Before creating examples, create a temp file with words data. This allows us to retrieve that data
-        # in the event of a problem with the examples.
-        with open('~temp', 'wb') as words_temp_file:
-            pickle.dump(words, words_temp_file)
-
-        output_combined(args.words_output_file_name, words, args.delimiter,
-                        args.thread_count, args.show_chrome)
+def select_by_pinyin(word_to_process, word_pinyin, entries, combine_exact_defs=False):
+    """
+    Picks the entries for a word whose pinyin we already know
+
+    :param str word_to_process: The word from the list
+    :param str word_pinyin: The word's pinyin. Ex: shun4jian1, Yue1se4fu1 or lan2//lu4
+    :param list entries: The entries for the word as returned by fetch_word_entries
+    :param bool combine_exact_defs: Keep every entry with the word's characters and pinyin instead of only the first
+    :return: Returns the chosen entries. Entries that only say the word is a surname, a variant or to see another
+             word are passed over if there is anything better. The list is empty if no entry has the pinyin.
+    :rtype: list
+    """
+
+    simplified_word = conversion.to_simplified(word_to_process)
+    key = pinyin.comparison_key(word_pinyin)
+
+    matches = [entry for entry in entries
+               if (entry["traditional"] == word_to_process or entry["simplified"].strip() == simplified_word)
+               and pinyin.comparison_key(entry["pinyin"]) == key]
+
+    useful = [entry for entry in matches
+              if not any("surname" in str(definition).lower() or "variant of" in str(definition).lower()
+                         or str(definition).lower().startswith("see ") for definition in entry["defs"])]
+
+    matches = useful or matches
+
+    logging.info(str(len(matches)) + " of " + str(len(entries)) + " entries for " + word_to_process + " are read " +
+                 word_pinyin + ".")
+
+    return matches if combine_exact_defs else matches[:1]
+
+
+def keep_entries(entry_list, enrich=True):
+    """
+    Finishes off the entries chosen for a word. Each gets its final_traditional, numbered if there is more than one.
+
+    :param list entry_list: The chosen entries
+    :param bool enrich: Whether to run enrich_word_entry on them. See process_word.
+    :return: Returns the entries
+    :rtype: list
+    """
+
+    if len(entry_list) > 1:
+        for index, entry in enumerate(entry_list):
+            entry["final_traditional"] = "(" + str(index + 1) + ") " + entry["traditional"]
+    else:
+        entry_list[0]["final_traditional"] = entry_list[0]["traditional"]
+
+    # Only now that we know which entries are being kept do we pay for the hanzicraft and history lookups.
+    if enrich:
+        for entry in entry_list:
+            enrich_word_entry(entry)
+
+    return entry_list
+
+
+def build_incremental(words, journal=None):
+    """
+    Updates the flashcard file in place. Cards for words that were in the previous build, made with the same options,
+    are carried over from it and only new or changed words are looked up and rendered. The deck is written in input
+    order along with its manifest. See deck_manifest.
+
+    :param list words: The words from the input file
+    :param checkpoint_journal.CheckpointJournal journal: Passed through to get_words and output_combined
+    :return: Returns nothing
+    """
+
+    words = [word.strip() for word in words]
+    fingerprint = deck_manifest.options_fingerprint(args)
+
+    previous = deck_manifest.load_previous_build(args.words_output_file_name, args.manifest_file)
+    cards = {word: word_cards for word, (word_fingerprint, word_cards) in previous.items()
+             if word_fingerprint == fingerprint}
+
+    to_build = [word for word in dict.fromkeys(words) if word not in cards]
+    unfinished = set()  # type: set
+
+    logging.info(str(len(to_build)) + " of " + str(len(set(words))) + " words are new or were built with different "
+                 "options. Reusing the cards for the rest.")
+
+    if to_build:
+        grouped = get_words(to_build, skip_choices=args.skip_choices,
+                            ask_if_match_not_found=args.ask_if_match_not_found,
+                            combine_exact_defs=args.combine_exact,
+                            preference_hsk=args.preference_hsk,
+                            lookup_concurrency=args.lookup_concurrency,
+                            journal=journal, group_by_word=True) or []
+
+        entries = [entry for word, word_entries in grouped for entry in word_entries]
+
+        new_cards = []  # type: list
+        if entries:
+            # Render the new cards on their own with the usual machinery, keeping them in memory to merge them in
+            output_combined(args.words_output_file_name, entries, args.delimiter,
+                            args.thread_count, args.show_chrome, args.driver_max_uses, args.example_backend,
+                            args.naver_api_url, args.stream_output, args.reorder_window, journal=journal,
+                            naver_prefetch=args.naver_prefetch, shared_characters=args.character_media,
+                            media_dir=args.media_dir, card_lines=new_cards)
+
+        position = 0
+        for word, word_entries in grouped:
+            word_cards = new_cards[position:position + len(word_entries)]
+            position = position + len(word_entries)
+
+            cards[word] = [card for _, _, card in word_cards]
+
+            # Examples that failed, or raised and came back as None, and missing history are retried next time
+            if any(examples_html is None or isinstance(examples_html, ExampleFailure)
+                   for _, examples_html, _ in word_cards) or \
+                    any(entry.get("history_failed") for entry in word_entries):
+                unfinished.add(word)
+
+    # Words that failed this time are left out of the deck and the manifest so the next run tries them again. Words
+    # whose cards are missing something keep them but aren't given the fingerprint, so they are rebuilt next time.
+    deck_manifest.write_build(args.words_output_file_name,
+                              [(word, None if word in unfinished else fingerprint, cards[word])
+                               for word in words if word in cards],
+                              args.manifest_file)
+
+
+def lookup_card(word_to_process, example_drivers=None):
+    """
+    Looks a single word up the same way the flashcard file is built, choosing the closest match without prompting,
+    and returns everything the lookup server sends back for it
+
+    :param str word_to_process: The word to look up
+    :param driver_pool.DriverPool example_drivers: The pool used by the selenium example backend. Without one a
+                                                   browser is started and quit for each entry.
+    :return: Returns the word and each selected entry along with its rendered examples and finished card
+    :rtype: dict
+    :raises lookup_server.NotFound: If no entry could be chosen without asking
+    """
+
+    try:
+        entries = process_word(word_to_process, skip_choices=True, ask_if_match_not_found=False,
+                               combine_exact_defs=args.combine_exact, preference_hsk=args.preference_hsk)
+    except IndexError:
+        # keep_entries is handed an empty list when no entry could be chosen without asking
+        entries = []
+
+    if not entries:
+        raise lookup_server.NotFound("No entry for " + word_to_process + " could be chosen without asking.")
+
+    results = []
+    for entry in entries:
+        examples_html = get_examples_html(entry["simplified"], entry["pinyin"], is_server=False,
+                                          show_chrome=args.show_chrome, driver_pool=example_drivers,
+                                          backend=args.example_backend, naver_api_url=args.naver_api_url,
+                                          naver_prefetch=args.naver_prefetch)
+        results.append(dict(entry, examples=examples_html, card=format_card(entry, examples_html, args.delimiter)))
+
+    return {"word": word_to_process, "entries": results}
+
+
+def run_server():
+    """
+    Runs the lookup service for --run-server until it is interrupted. The browser pools, HTTP sessions, caches and
+    compiled template are created once here and shared by every request.
+
+    :return: Returns nothing
+    """
+
+    example_drivers = DriverPool(lambda: create_driver(headless=not args.show_chrome), args.thread_count,
+                                 max_uses=args.driver_max_uses)
+
+    # Pay for the cold start now rather than on the first request
+    rendering.get_examples_template()
+    if args.example_backend == "http":
+        naver_examples.get_session(pool_size=args.thread_count * args.naver_prefetch)
+        naver_examples.get_page_executor(workers=args.thread_count * args.naver_prefetch)
+
+    def examples_only(word, word_pinyin):
+        return get_examples_html(word, word_pinyin, driver_pool=example_drivers, backend=args.example_backend,
+                                 naver_api_url=args.naver_api_url, naver_prefetch=args.naver_prefetch)
+
+    server = lookup_server.LookupServer(lambda word: lookup_card(word, example_drivers), examples_only,
+                                        port=args.port, max_workers=args.thread_count, timeout=args.request_timeout,
+                                        host=args.host)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down the lookup server.")
+    finally:
+        example_drivers.close()
+
+
+def build_parser():
+    """
+    :return: Returns the parser for the command line options. Library users can use it to build the options passed
+             to configure.
+    :rtype: ArgumentParser
+    """
+
+    parser = ArgumentParser(description="Used to create Anki flash cards based on data from the website www.mdbg.net")
+    parser.add_argument('--file', metavar='FILE', dest="input_file_name", type=str, required=False,
+                        help='The path to a newline delimited list of Chinese words or characters in Hanji The default'
+                             'is new_words.txt. A word may be followed by a tab and its numbered pinyin, '
+                             'ex: 瞬間<tab>shun4jian1, in which case the entry with that pinyin is used without asking.',
+                        default="input.txt")
+    parser.add_argument('--words-output-file', metavar='WORDS-OUTPUT-FILE', dest="words_output_file_name", type=str,
+                        required=False, default="word_list.txt",
+                        help='By default this is word_list.txt, or word_list.apkg with --output-format apkg. You may '
+                             'change it by providing this argument.')
+    parser.add_argument('--output-format', dest="output_format", required=False, type=str, default="text",
+                        choices=['text', 'apkg'],
+                        help='text writes a delimited file for Anki\'s text import. apkg writes an Anki package of '
+                             '"Chinese Words Updated" notes which is imported in one step with File > Import.')
+    parser.add_argument('--deck-name', metavar='DECK_NAME', dest="deck_name", required=False, type=str,
+                        default=anki_package.DEFAULT_DECK_NAME,
+                        help='With --output-format apkg, the name of the deck the cards go in.')
+    parser.add_argument('--character-media', dest="character_media", required=False, action='store_true',
+                        default=False,
+                        help='Write the hanzicraft breakdown and history of each character once, as a file in Anki\'s '
+                             'media, instead of copying them into every card with that character. With --output-format '
+                             'text the files go in --media-dir. The cards only look the same where card JavaScript '
+                             'runs: clients that don\'t run it, or lack document.currentScript, show no breakdown or '
+                             'history at all, and neither can be found with Anki\'s search any more. Off by default.')
+    parser.add_argument('--media-dir', metavar='MEDIA_DIR', dest="media_dir", required=False, type=str, default=None,
+                        help='Your Anki collection.media folder. On Windows it is found from --anki-username.')
+    parser.add_argument('--skip-choices', dest="skip_choices", required=False, action='store_true', default=False,
+                        help='This option will tell the program to just select the closest match for the '
+                             'word_to_process.')
+    parser.add_argument('--ask-if-match-not-found', dest="ask_if_match_not_found", required=False, action='store_true',
+                        default=False, help='Will only ask for input if an exact match between the pinyin and a '
+                                            'character isn\'t found.')
+    parser.add_argument('--combine-exact', dest="combine_exact", required=False, action='store_true',
+                        default=False, help='Will instruct the program to automatically store all definitions matched'
+                                            ' in MDBG.')
+    parser.add_argument('--preference-hsk', dest="preference_hsk", required=False, action='store_true',
+                        default=False,
+                        help='Uses whether a word_to_process is from HSK vocab as a tiebreaker between multiple'
+                             ' matching words. Discards non-HSK words.')
+    parser.add_argument('--resume', dest="resume", required=False, action='store_true', default=False,
+                        help='As each word is looked up and each example is created it is recorded in a journal '
+                             '(~journal by default). Using the same syntax you did to originally run the program, you '
+                             'can add --resume if for some reason the program died and only the unfinished words will '
+                             'be done.')
+    parser.add_argument('--incremental', dest="incremental", required=False, action='store_true', default=False,
+                        help='Update the existing flashcard file instead of rebuilding it. Only words that are new, or '
+                             'whose cards were made with different options, are looked up. The rest are carried over. '
+                             'A manifest is kept next to the flashcard file to make this possible.')
+    parser.add_argument('--manifest-file', metavar='MANIFEST_FILE', dest="manifest_file", required=False, type=str,
+                        default=None, help='The manifest used by --incremental. Defaults to the flashcard file with '
+                                           '.manifest.json added.')
+    parser.add_argument('--journal-file', metavar='JOURNAL_FILE', dest="journal_file", required=False, type=str,
+                        default="~journal", help='The file in which finished lookups and examples are recorded for '
+                                                 '--resume.')
+    parser.add_argument('--log-level', metavar='LOG_LEVEL', dest="log_level", required=False, type=str, default="info",
+                        choices=['debug', 'info', 'warning', 'error', 'critical'],
+                        help='A path to Chinese Blockbuster in EPUB format. In my case, I bought all of them and merged'
+                             ' them into one big book.')
+    parser.add_argument('--delimiter', metavar='DELIMITER', dest="delimiter", required=False, type=str, default="\\",
+                        help='Allows you to optionally select the delimiter you use for the delimiter in your Anki'
+                             'cards. By default it is ~ which should avoid colliding with anything.')
+    parser.add_argument('--anki-username', metavar='ANKI_USERNAME', dest="anki_username", required=False, type=str,
+                        default="User 1", help='Your Anki username.')
+    parser.add_argument('--run-server', dest="run_server", required=False, action='store_true', default=False,
+                        help='Instead of writing out flashcards, we will start a server where you can query '
+                             'for words and examples. This will supersede all other arguments.')
+    parser.add_argument('--port', dest="port", required=False, type=int, default=5000,
+                        help='Specify the port you want the server to run on')
+    parser.add_argument('--host', dest="host", required=False, type=str, default=lookup_server.DEFAULT_HOST,
+                        help='The address the server listens on. The server has no authentication so by default only '
+                             'this machine can reach it. Use 0.0.0.0 to listen on every interface.')
+    parser.add_argument('--request-timeout', dest="request_timeout", required=False, type=float,
+                        default=lookup_server.DEFAULT_TIMEOUT,
+                        help='With --run-server, the most seconds a request may take. Clients may ask for less with a '
+                             'timeout parameter.')
+    parser.add_argument('--mdbg-url', dest="mdbg_url", required=False, type=str,
+                        default="https://www.mdbg.net/chinese/dictionary?page=worddict&wdrst=1&wdqb=",
+                        help='The MDBG search URL. The word is appended to it. Useful for pointing the program at a '
+                             'stub server.')
+    parser.add_argument('--hanzicraft-backend', dest="hanzicraft_backend", required=False, type=str,
+                        default="selenium", choices=['selenium', 'http'],
+                        help='How to load hanzicraft pages. selenium uses pooled Chrome instances. http fetches the '
+                             'page directly without a browser.')
+    parser.add_argument('--hanzicraft-url', dest="hanzicraft_url", required=False, type=str,
+                        default="https://hanzicraft.com/character/",
+                        help='The hanzicraft character URL. The characters are appended to it. Useful for pointing the '
+                             'program at a stub server.')
+    parser.add_argument('--dictionary-backend', dest="dictionary_backend", required=False, type=str, default="mdbg",
+                        choices=['mdbg', 'cedict'],
+                        help='Where to look words up. mdbg scrapes www.mdbg.net. cedict uses a local copy of CC-CEDICT '
+                             'given by --cedict-file.')
+    parser.add_argument('--cedict-file', metavar='CEDICT_FILE', dest="cedict_file", required=False, type=str,
+                        default="cedict_ts.u8", help='The CC-CEDICT file used by --dictionary-backend cedict. An index '
+                                                     'is built next to it the first time it is used.')
+    parser.add_argument('--hsk-lists', metavar='HSK_LIST', dest="hsk_lists", required=False, type=str, nargs='*',
+                        default=[], help='Newline delimited HSK word lists used to fill in HSK levels with '
+                                         '--dictionary-backend cedict. The level is taken from the file name, so '
+                                         'hsk_4.txt holds the HSK 4 words.')
+    parser.add_argument('--html-parser', dest="html_parser", required=False, type=str, default="html.parser",
+                        choices=html_parsing.PARSERS,
+                        help='The parser used on MDBG, hanzicraft and Naver pages. lxml is considerably faster but '
+                             'must be installed separately.')
+    parser.add_argument('--cpu-workers', dest="cpu_workers", required=False, type=int, default=0,
+                        help='Hand parsing, hanzicraft post-processing and minification to this many worker processes '
+                             'so the threads doing the fetching only wait on the network. Set it to the number of '
+                             'cores to scale with them. 0 does the work on the fetching threads.')
+    parser.add_argument('--cpu-queue-size', dest="cpu_queue_size", required=False, type=int, default=None,
+                        help='With --cpu-workers, the most pages that may be waiting on or being processed by the '
+                             'workers at once. Fetching threads wait when it is full. Defaults to twice '
+                             '--cpu-workers.')
+    parser.add_argument('--lookup-concurrency', dest="lookup_concurrency", required=False, type=int, default=8,
+                        help='The number of words looked up on MDBG at the same time.')
+    parser.add_argument('--thread-count', dest="thread_count", required=False, type=int, default=5,
+                        help='Specify the number of worker threads with which you want to grab examples.')
+    parser.add_argument('--show-chrome', dest="show_chrome", required=False, action='store_true',
+                        help='Will disable headless mode on Chromedriver and cause the browser to pop up')
+    parser.add_argument('--driver-max-uses', dest="driver_max_uses", required=False, type=int, default=DEFAULT_MAX_USES,
+                        help='The number of words a pooled example browser handles before it is restarted.')
+    parser.add_argument('--example-backend', dest="example_backend", required=False, type=str, default="http",
+                        choices=['http', 'selenium'],
+                        help='How to get example sentences from Naver. http asks Naver\'s JSON endpoint directly. '
+                             'selenium renders the Naver page in Chrome and is kept as a fallback.')
+    parser.add_argument('--naver-api-url', dest="naver_api_url", required=False, type=str,
+                        default=naver_examples.NAVER_EXAMPLE_API,
+                        help='The Naver example endpoint used by the http example backend. Useful for pointing the '
+                             'program at a stub server.')
+    parser.add_argument('--naver-prefetch', dest="naver_prefetch", required=False, type=int,
+                        default=naver_examples.DEFAULT_PREFETCH,
+                        help='The number of Naver example pages the http example backend fetches at once for a word. '
+                             'Pages are still read in order and the rest are cancelled once enough examples are '
+                             'found. 1 fetches one page at a time.')
+    parser.add_argument('--stream-output', dest="stream_output", required=False, action='store_true', default=False,
+                        help='Write each card as soon as its examples are ready instead of waiting for every word. '
+                             'Cards still come out in input order.')
+    parser.add_argument('--reorder-window', dest="reorder_window", required=False, type=int, default=None,
+                        help='With --stream-output, the most words whose examples may be in flight or waiting to be '
+                             'written at once. Defaults to four times --thread-count.')
+    parser.add_argument('--api-address', dest="api_address", required=False, default="127.0.0.1:5000", help="The API "
+                        "address of the character server used to look up history.")
+    parser.add_argument('--cache-dir', metavar='CACHE_DIR', dest="cache_dir", required=False, type=str,
+                        default=".flashcard_cache", help='The directory in which responses from MDBG, hanzicraft, '
+                                                         'Naver and the history API are cached between runs.')
+    parser.add_argument('--no-cache', dest="no_cache", required=False, action='store_true', default=False,
+                        help='Do not read from or write to the response cache.')
+    parser.add_argument('--refresh', dest="refresh", required=False, action='store_true', default=False,
+                        help='Ignore anything already in the response cache and fetch everything again. The fresh '
+                             'responses are written back to the cache.')
+    parser.add_argument('--cache-max-mb', dest="cache_max_mb", required=False, type=int, default=512,
+                        help='The maximum size of the response cache in megabytes. Least recently used responses are '
+                             'evicted past this.')
+    parser.add_argument('--host-limit', metavar='HOST=CONCURRENCY[:RATE]', dest="host_limits", required=False,
+                        action='append', default=[], type=request_scheduler.parse_limit,
+                        help='Override how many requests may be in flight to a host at once and, optionally, how many '
+                             'may be started a second. Hosts are mdbg, hanzicraft, naver and history. A concurrency of '
+                             '0 means no limit. Ex: --host-limit naver=8:4. May be given more than once. Defaults: ' +
+                             ", ".join(host + "=" + str(concurrency) for host, (concurrency, _) in
+                                       request_scheduler.DEFAULT_LIMITS.items()) + '.')
+    parser.add_argument('--max-retries', dest="max_retries", required=False, type=int,
+                        default=request_scheduler.DEFAULT_MAX_RETRIES,
+                        help='How many times a request that times out, fails to connect or comes back 429 or 5xx is '
+                             'retried, with exponential backoff, before giving up.')
+    parser.add_argument('--cache-ttl', metavar='SOURCE=DAYS', dest="cache_ttl", required=False, action='append',
+                        default=[], help='Override how many days responses from a source stay in the cache. Sources '
+                                         'are mdbg, hanzicraft, history and naver. May be given more than once.')
+    parser.add_argument('--metrics', dest="metrics", required=False, action='store_true', default=False,
+                        help='Time each stage of the run (MDBG, hanzicraft, history API, Naver, parsing, minification) '
+                             'and print a summary at the end.')
+    parser.add_argument('--metrics-out', metavar='METRICS_FILE', dest="metrics_out", required=False, type=str,
+                        default=None, help='Also write the metrics to this file. Implies --metrics. Files ending in '
+                                           '.prom are written in the Prometheus textfile format and anything else as '
+                                           'JSON.')
+    parser.add_argument('--print-usage', dest="print_usage", required=False, action='store_true',
+                        help='Show example usage.')
+    parser.add_argument('--show-usage', dest="print_usage", required=False, action='store_true',
+                        help='Show example usage.')
+
+    return parser
+
+
+def configure(options):
+    """
+    Sets up everything the lookups share: the response cache, the dictionary, the history client, the hanzicraft
+    browser pool and registry. Nothing is started here. Browsers are only launched when a stage asks for one. Used by
+    main and by anyone using this module as a library:
+
+        import chinese_flashcard_maker as maker
+        maker.configure(maker.build_parser().parse_args(["--dictionary-backend", "cedict"]))
+        card = maker.lookup_card("着急")
+
+    :param argparse.Namespace options: The options as parsed by the parser from build_parser
+    :return: Returns the options with their defaults filled in
+    :rtype: argparse.Namespace
+    """
+    global args, image_path, cache, dictionary, history_client, hanzicraft_drivers, hanzicraft_registry
+
+    args = options
+
+    ssl._create_default_https_context = ssl._create_unverified_context
+
+    if args.ask_if_match_not_found:
+        args.skip_choices = True
+
+    # The Anki media folder is only known on Windows. Nothing else depends on the platform so everywhere else, the
+    # benchmarks included, we just carry on without it.
+    if 'Windows' in platform.system():
+        image_path = path.join(getenv("APPDATA"), "Anki2", args.anki_username, "collection.media")
+    else:
+        image_path = None
+
+    if not args.media_dir:
+        args.media_dir = image_path
+
+    if args.output_format == "apkg" and args.words_output_file_name == "word_list.txt":
+        args.words_output_file_name = "word_list.apkg"
+
+    if not args.delimiter:
+        args.delimiter = "\\"
     else:
-        print(args.input_file_name + " is not a file or doesn't exist!")
+        args.delimiter = args.delimiter.strip('\'').strip('\"')
+
+    if not args.no_cache:
+        cache_ttls = {}
+        for cache_ttl in args.cache_ttl:
+            source, days = cache_ttl.split("=")
+            cache_ttls[source.strip()] = float(days) * response_cache.DAY
+        cache = response_cache.ResponseCache(args.cache_dir, ttls=cache_ttls,
+                                             max_size=args.cache_max_mb * 1024 * 1024, refresh=args.refresh)
+        atexit.register(cache.close)
+
+    if args.metrics or args.metrics_out:
+        metrics.enable()
+
+    request_scheduler.configure(args.host_limits, max_retries=args.max_retries)
+
+    if args.dictionary_backend == "cedict":
+        dictionary = CedictDictionary(args.cedict_file, hsk_lists=args.hsk_lists)
+
+    history_client = HistoryClient(args.api_address, max_workers=args.lookup_concurrency, cache=cache)
+
+    hanzicraft_drivers = DriverPool(lambda: create_driver(headless=not args.show_chrome), args.thread_count,
+                                    max_uses=args.driver_max_uses)
+    # The registry hands each page over and waits. Every thread after the character's first is already waiting on
+    # the same entry, so only the owner's I/O thread is held and there is nothing else it could usefully be doing.
+    hanzicraft_registry = CharacterRegistry(fetch_hanzicraft_page,
+                                            lambda html: cpu_pool.run(hanzicraft.process_hanzicraft_page, html))
+
+    cpu_pool.start(args.cpu_workers, args.cpu_queue_size, parser=html_parsing.set_parser(args.html_parser))
+
+    return args
+
+
+def main(argv=None):
+    """
+    The command line entry point
+
+    :param list argv: The command line arguments. Defaults to sys.argv.
+    :return: Returns nothing
+    """
+
+    parser = build_parser()
+    options = parser.parse_args(argv)
+
+    if not options.run_server and not options.input_file_name and not options.print_usage:
+        parser.print_help()
+        exit(0)
+
+    if options.print_usage:
+        print('python chinese_flashcard_maker.py --anki-username "User 1" --file input.txt --skip-choices --show-chrome --delimiter \ --combine-exact --preference-hsk --api-address 192.168.1.83:5000')
+        print('\nVisual Studio Code regex for excluding lines starting with asterisk: ^(?!\*).*\\n')
+        print('\nMapping for "Chinese Words Updated" is:')
+        print('Traditional\nSimplified\nPinyin\nMeaning\nTags\nHistory\nCharacters')
+        exit(0)
+
+    if options.log_level:
+        if options.log_level == "debug":
+            logging.basicConfig(level=logging.DEBUG)
+        elif options.log_level == "info":
+            logging.basicConfig(level=logging.INFO)
+        elif options.log_level == "warning":
+            logging.basicConfig(level=logging.WARNING)
+        elif options.log_level == "error":
+            logging.basicConfig(level=logging.ERROR)
+        elif options.log_level == "critical":
+            logging.basicConfig(level=logging.CRITICAL)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    if options.dictionary_backend == "cedict" and not Path(options.cedict_file).is_file():
+        print(options.cedict_file + " is not a file or doesn't exist! It is required by --dictionary-backend cedict.")
+        exit(0)
+
+    if options.incremental and options.output_format != "text":
+        print("--incremental only works with --output-format text.")
         exit(0)
-elif args.resume:
 
-    with open('~temp', 'rb') as words_temp_file:
-        words = pickle.load(words_temp_file)
+    configure(options)
+
+    if args.character_media and args.output_format == "text" and not (args.media_dir and path.isdir(args.media_dir)):
+        print("--character-media with --output-format text needs --media-dir to be your Anki collection.media folder.")
+        exit(0)
+
+    try:
+        if args.run_server:
+            run_server()
+        elif args.input_file_name:
+            if Path(args.input_file_name).is_file():
+                words = []
+                with open(args.input_file_name, encoding="utf-8-sig") as input_file:
+                    for word in input_file.readlines():
+                        if word.strip() != "":
+                            words.append(word)
+
+                # Every finished lookup and example is written to the journal as it completes. With --resume anything
+                # already in the journal is skipped.
+                journal = CheckpointJournal(args.journal_file, resume=args.resume)
+
+                if args.incremental:
+                    build_incremental(words, journal=journal)
+                else:
+                    words = get_words(words, skip_choices=args.skip_choices,
+                                      ask_if_match_not_found=args.ask_if_match_not_found,
+                                      combine_exact_defs=args.combine_exact,
+                                      preference_hsk=args.preference_hsk,
+                                      lookup_concurrency=args.lookup_concurrency,
+                                      journal=journal)
+
+                    output_combined(args.words_output_file_name, words, args.delimiter,
+                                    args.thread_count, args.show_chrome, args.driver_max_uses, args.example_backend,
+                                    args.naver_api_url, args.stream_output, args.reorder_window, journal=journal,
+                                    naver_prefetch=args.naver_prefetch, output_format=args.output_format,
+                                    deck_name=args.deck_name, shared_characters=args.character_media,
+                                    media_dir=args.media_dir)
+
+                journal.close()
+            else:
+                print(args.input_file_name + " is not a file or doesn't exist!")
+                exit(0)
+        else:
+            print("No input file name specified! You must provide a word_to_process list or run a server!")
+            exit(0)
+    finally:
+        hanzicraft_drivers.close()
+        cpu_pool.shutdown()
+
+    logging.info("Requests by host:\n" + request_scheduler.summary())
+
+    if metrics.enabled:
+        print(metrics.summary())
+        print(request_scheduler.summary())
+        if args.metrics_out:
+            metrics.write(args.metrics_out)
 
-    output_combined(args.words_output_file_name, words, args.delimiter,
-                    args.thread_count, args.show_chrome)
-else:
-    print("No input file name specified! You must provide a word_to_process list or run a server!")
-    exit(0)
 
-driver.close()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Traditional/simplified conversion. HanziConv converts a string by searching its 2,700 character mapping string once
+for every character, every time, and we convert the same short words over and over. Here the mapping is turned into a
+str.translate table once, single strings are memoized in a bounded LRU and whole word lists can be converted in a
+single translate call. Results are identical to HanziConv's, which stays the source of the character data.
+"""
+
+from functools import lru_cache
+
+DEFAULT_CACHE_SIZE = 65536
+
+# Built from hanziconv's character maps the first time a conversion is asked for
+_tables = {}  # type: dict
+
+
+def _table(to_traditional):
+    """
+    :param bool to_traditional: True for simplified to traditional, False for traditional to simplified
+    :return: Returns the str.translate table for the direction
+    :rtype: dict
+    """
+
+    table = _tables.get(to_traditional)
+
+    if table is None:
+        from hanziconv.charmap import simplified_charmap, traditional_charmap
+
+        from_map, to_map = (simplified_charmap, traditional_charmap) if to_traditional else \
+            (traditional_charmap, simplified_charmap)
+
+        # HanziConv uses the first place a character appears in the map so we do too
+        table = {}
+        for from_character, to_character in zip(from_map, to_map):
+            table.setdefault(ord(from_character), to_character)
+
+        _tables[to_traditional] = table
+
+    return table
+
+
+@lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def to_simplified(text):
+    """
+    :param str text: Text in traditional characters. Ex: 瞬間
+    :return: Returns the text in simplified characters. Ex: 瞬间
+    :rtype: str
+    """
+    return text.translate(_table(False))
+
+
+@lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def to_traditional(text):
+    """
+    :param str text: Text in simplified characters. Ex: 瞬间
+    :return: Returns the text in traditional characters. Ex: 瞬間
+    :rtype: str
+    """
+    return text.translate(_table(True))
+
+
+def bulk_to_simplified(texts):
+    """
+    Converts a whole list in one pass. Better than calling to_simplified in a loop when most of the strings are only
+    seen once.
+
+    :param list texts: Strings in traditional characters. None of them may contain a newline.
+    :return: Returns the strings in simplified characters, in the same order
+    :rtype: list
+    """
+    if not texts:
+        return []
+    return "\n".join(texts).translate(_table(False)).split("\n")
+
+
+def bulk_to_traditional(texts):
+    """
+    :param list texts: Strings in simplified characters. None of them may contain a newline.
+    :return: Returns the strings in traditional characters, in the same order
+    :rtype: list
+    """
+    if not texts:
+        return []
+    return "\n".join(texts).translate(_table(True)).split("\n")
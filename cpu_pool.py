@@ -0,0 +1,164 @@
+"""
+The CPU stage of the pipeline. Parsing MDBG pages, cutting up hanzicraft pages and rendering and minifying examples
+is pure Python work which holds the GIL, so running it on the same threads that wait on the network stops scaling
+long before the network is busy. With --cpu-workers the I/O threads only fetch raw HTML and hand it to a pool of
+worker processes for the CPU work.
+
+The I/O stage and the CPU stage are joined by a bounded queue: at most max_pending jobs may be waiting on or running
+in the pool and an I/O thread that tries to hand over more blocks until one finishes. submit hands a job over and
+returns a future straight away so the I/O thread can go on to its next fetch while the job runs, which lets the pool
+keep every worker busy no matter how many I/O threads there are. Without a pool every job runs inline on the calling
+thread, exactly as before.
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import html_parsing
+import metrics
+
+_executor = None  # type: ProcessPoolExecutor
+_slots = None  # type: threading.BoundedSemaphore
+
+
+def _initialize_worker(parser):
+    html_parsing.set_parser(parser)
+
+
+def _timed(function, *args):
+    # Runs in the worker so the time a job spends queued for a free worker isn't counted as work
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def start(workers, max_pending=None, parser="html.parser"):
+    """
+    Starts the worker processes. Workers are spawned rather than forked since the I/O threads are already running.
+
+    :param int workers: The number of worker processes. 0 leaves the CPU work on the calling threads.
+    :param int max_pending: The most jobs waiting on or running in the pool at once. Defaults to twice workers.
+    :param str parser: The HTML parser the workers should use. See html_parsing.set_parser.
+    :return: Returns nothing
+    """
+    global _executor, _slots
+
+    if workers <= 0:
+        return
+
+    logging.info("Starting " + str(workers) + " processes for parsing and minification.")
+
+    _slots = threading.BoundedSemaphore(max_pending or workers * 2)
+    _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_initialize_worker, initargs=(parser,))
+
+
+def submit(function, *args):
+    """
+    Hands a job to the CPU stage without waiting for it. Blocks only while max_pending jobs are already queued.
+
+    :param function: A module level function, so that it can be sent to a worker process
+    :param args: The arguments for the function. They and the result must be picklable.
+    :return: Returns a future for whatever the function returns. Without a pool the job has already run.
+    :rtype: concurrent.futures.Future
+    """
+
+    if _executor is None:
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    _slots.acquire()
+    try:
+        job = _executor.submit(_timed, function, *args)
+    except BaseException:
+        _slots.release()
+        raise
+
+    future = Future()
+    name = "cpu_" + function.__name__
+
+    def finished(_):
+        _slots.release()
+
+        if job.cancelled():
+            future.cancel()
+        elif job.exception() is not None:
+            future.set_exception(job.exception())
+        else:
+            result, elapsed = job.result()
+            # Anything the function times itself happens in the worker, out of sight of our metrics, so the
+            # worker times the whole job and we record it here
+            metrics.record(name, elapsed)
+            future.set_result(result)
+
+    job.add_done_callback(finished)
+
+    return future
+
+
+def run(function, *args):
+    """
+    Runs a job in the CPU stage and waits for its result. See submit.
+
+    :return: Returns whatever the function returns
+    """
+    return submit(function, *args).result()
+
+
+def completed(result):
+    """
+    :param result: A result we already have
+    :return: Returns a future which is already done with the result, for callers that usually get one from submit
+    :rtype: concurrent.futures.Future
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def flatten(future):
+    """
+    Turns a future whose result is another future, like an I/O job that ends by calling submit, into a single future
+
+    :param concurrent.futures.Future future: The outer future
+    :return: Returns a future for the inner future's result. An exception from either one is passed on.
+    :rtype: concurrent.futures.Future
+    """
+
+    result = Future()
+
+    def inner_done(inner):
+        if inner.exception() is not None:
+            result.set_exception(inner.exception())
+        else:
+            result.set_result(inner.result())
+
+    def outer_done(outer):
+        if outer.exception() is not None:
+            result.set_exception(outer.exception())
+        else:
+            outer.result().add_done_callback(inner_done)
+
+    future.add_done_callback(outer_done)
+
+    return result
+
+
+def shutdown():
+    """
+    Stops the worker processes, if there are any
+
+    :return: Returns nothing
+    """
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
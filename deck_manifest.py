@@ -0,0 +1,127 @@
+"""
+The sidecar manifest that makes incremental builds possible. Next to the flashcard file we keep a small JSON file
+listing, in deck order, each input word, a fingerprint of the options that shaped its cards and how many lines of the
+deck its cards take up. A card is usually one line but a field holding a line break spreads it over more. With that
+we can tell which lines of the previous deck belong to which word, so only words that are new or whose options
+changed have to be looked up and rendered again.
+
+The manifest also records a hash of the deck it describes. If the deck has been changed or replaced since, the
+manifest no longer applies and everything is rebuilt.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from os import path
+
+MANIFEST_VERSION = 2
+
+# The options that change what ends up on a word's cards
+FINGERPRINTED_OPTIONS = ["skip_choices", "ask_if_match_not_found", "combine_exact", "preference_hsk", "delimiter",
+                         "dictionary_backend", "character_media"]
+
+
+def manifest_path(deck_path):
+    """
+    :param str deck_path: The flashcard file
+    :return: Returns where the manifest for the flashcard file lives by default
+    :rtype: str
+    """
+    return deck_path + ".manifest.json"
+
+
+def options_fingerprint(options):
+    """
+    :param argparse.Namespace options: The parsed command line options
+    :return: Returns a short hash of the options in FINGERPRINTED_OPTIONS
+    :rtype: str
+    """
+    relevant = {name: getattr(options, name, None) for name in FINGERPRINTED_OPTIONS}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as hashed_file:
+        for block in iter(lambda: hashed_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_previous_build(deck_path, manifest_file=None):
+    """
+    Reads the previous deck back in using its manifest
+
+    :param str deck_path: The flashcard file
+    :param str manifest_file: The manifest. Defaults to manifest_path(deck_path).
+    :return: Returns a dictionary mapping each input word to a tuple of (options fingerprint, list of the deck's lines
+             holding its cards). It is empty if there is no usable previous build.
+    :rtype: dict
+    """
+
+    manifest_file = manifest_file or manifest_path(deck_path)
+
+    if not path.isfile(manifest_file) or not path.isfile(deck_path):
+        logging.info("There is no previous build of " + deck_path + " to add to. Building every word.")
+        return {}
+
+    with open(manifest_file, encoding="utf-8") as manifest:
+        try:
+            recorded = json.load(manifest)
+        except ValueError:
+            logging.warning(manifest_file + " is damaged. Building every word.")
+            return {}
+
+    if recorded.get("version") != MANIFEST_VERSION:
+        logging.warning(manifest_file + " was written by another version of the program. Building every word.")
+        return {}
+
+    if recorded.get("deck_sha256") != _file_hash(deck_path):
+        logging.warning(deck_path + " has changed since " + manifest_file + " was written. Building every word.")
+        return {}
+
+    # Only \n ends a line. A \r inside a field is left alone, as it was written.
+    with open(deck_path, encoding="utf-8-sig", newline="\n") as deck:
+        lines = deck.readlines()
+
+    if len(lines) != sum(word["lines"] for word in recorded["words"]):
+        logging.warning(manifest_file + " doesn't match " + deck_path + ". Building every word.")
+        return {}
+
+    previous = {}
+    position = 0
+    for word in recorded["words"]:
+        previous[word["word"]] = (word["options"], lines[position:position + word["lines"]])
+        position = position + word["lines"]
+
+    return previous
+
+
+def write_build(deck_path, words, manifest_file=None):
+    """
+    Writes the deck and its manifest. The deck is written to a temporary file first and moved into place so a crash
+    never leaves a half written deck behind a manifest that claims otherwise.
+
+    :param str deck_path: The flashcard file
+    :param list words: A list of (input word, options fingerprint, list of its cards) tuples in deck order. A
+                       fingerprint of None marks a word whose cards should be built again next time.
+    :param str manifest_file: The manifest. Defaults to manifest_path(deck_path).
+    :return: Returns nothing
+    """
+
+    manifest_file = manifest_file or manifest_path(deck_path)
+
+    with open(deck_path + ".tmp", 'w', encoding="utf-8-sig", newline="") as deck:
+        for _, _, cards in words:
+            deck.writelines(cards)
+    os.replace(deck_path + ".tmp", deck_path)
+
+    recorded = {"version": MANIFEST_VERSION,
+                "deck_sha256": _file_hash(deck_path),
+                "words": [{"word": word, "options": fingerprint, "lines": sum(card.count("\n") for card in cards)}
+                          for word, fingerprint, cards in words]}
+
+    with open(manifest_file + ".tmp", 'w', encoding="utf-8") as manifest:
+        json.dump(recorded, manifest, ensure_ascii=False)
+    os.replace(manifest_file + ".tmp", manifest_file)
@@ -0,0 +1,136 @@
+"""
+A bounded pool of long lived browser drivers. Starting Chrome costs far more than loading a page with it so rather
+than creating and quitting a driver for every word, worker threads check a driver out of the pool, use it and hand it
+back. Drivers are recycled after a set number of uses or as soon as one of them crashes.
+"""
+
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+DEFAULT_MAX_USES = 50
+
+
+class DriverPool:
+    """
+    Hands out at most size drivers at a time. Drivers are only started when they are first needed.
+    """
+
+    def __init__(self, factory, size, max_uses=DEFAULT_MAX_USES):
+        """
+        :param factory: A function taking no arguments that returns a new driver. Ex: create_driver
+        :param int size: The maximum number of drivers that may exist at once
+        :param int max_uses: How many times a driver may be checked out before it is quit and replaced
+        """
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+
+        self._idle = queue.LifoQueue()  # type: queue.LifoQueue
+        self._uses = {}  # type: dict
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def acquire(self):
+        """
+        Checks a driver out of the pool, blocking until one is free. A new driver is started if none are idle and
+        the pool isn't full.
+
+        :return: Returns a driver which must be given back with release
+        :rtype: selenium.webdriver.chrome.webdriver.WebDriver
+        """
+
+        self._slots.acquire()
+
+        if self._closed:
+            self._slots.release()
+            raise RuntimeError("The driver pool has been closed.")
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            driver = self.factory()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._uses[id(driver)] = 0
+
+        return driver
+
+    def release(self, driver, broken=False):
+        """
+        Gives a driver back to the pool
+
+        :param selenium.webdriver.chrome.webdriver.WebDriver driver: A driver obtained from acquire
+        :param bool broken: Set if the driver crashed or is otherwise no longer trustworthy. It will be quit.
+        :return: Returns nothing
+        """
+
+        with self._lock:
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+            retire = broken or self._closed or self._uses[id(driver)] >= self.max_uses
+            if retire:
+                self._uses.pop(id(driver), None)
+
+        if retire:
+            logging.debug("Retiring a driver from the pool.")
+            self._quit(driver)
+        else:
+            self._idle.put(driver)
+
+        self._slots.release()
+
+    @contextmanager
+    def checkout(self):
+        """
+        Context manager version of acquire/release. If the block raises a WebDriverException the driver is assumed
+        to have crashed and is replaced.
+
+        :return: Yields a driver
+        """
+
+        from selenium.common.exceptions import WebDriverException
+
+        driver = self.acquire()
+        try:
+            yield driver
+        except WebDriverException:
+            self.release(driver, broken=True)
+            raise
+        except BaseException:
+            self.release(driver)
+            raise
+        else:
+            self.release(driver)
+
+    def close(self):
+        """
+        Quits every idle driver. Drivers still checked out are quit when they are released.
+
+        :return: Returns nothing
+        """
+
+        self._closed = True
+
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._uses.pop(id(driver), None)
+            self._quit(driver)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.debug("Driver did not quit cleanly: " + str(e))
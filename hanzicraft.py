@@ -0,0 +1,139 @@
+"""
+Pulls the character breakdowns off of hanzicraft.com. The same characters turn up over and over again in a deck so the
+CharacterRegistry makes sure each distinct hanzicraft page is fetched and post-processed exactly once per run and
+shares the finished HTML with every entry that needs it.
+"""
+
+import threading
+from concurrent.futures import Future
+
+import html_parsing
+import metrics
+import request_scheduler
+
+
+TIMEOUT = 30
+
+_session = None  # type: requests.Session
+_session_lock = threading.Lock()
+
+
+def fetch_page_over_http(url):
+    """
+    Fetches a hanzicraft page without a browser. Connections are pooled across calls.
+
+    :param str url: The full URL of the character page
+    :return: Returns the page source
+    :rtype: str
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            import requests
+
+            _session = requests.Session()
+
+    r = request_scheduler.call("hanzicraft", lambda: _session.get(url, timeout=TIMEOUT))
+    r.raise_for_status()
+    metrics.increment("hanzicraft_bytes", len(r.content))
+    return r.content.decode('utf-8')
+
+
+def process_hanzicraft_page(html):
+    """
+    Cuts the #display block out of a hanzicraft page, strips the parts that don't belong on a flashcard, points the
+    links back at hanzicraft (or MDBG for words) and minifies the result
+
+    :param str html: The page source of a hanzicraft character page
+    :return: Returns the minified HTML for the Characters field
+    :rtype: str
+    """
+
+    with metrics.stage("hanzicraft_parse"):
+        soup = html_parsing.hanzicraft_display(html)  # type: bs4.element.Tag
+
+    for favorite_button in soup.find_all('button', id="addfav"):
+        favorite_button.decompose()
+
+    for character_nav in soup.find_all('div', {"class": "character-nav"}):
+        character_nav.decompose()
+
+    for index, word_block in enumerate(soup.find_all('div', {"class": "wordblock"})):
+        if index > 4:
+            word_block.decompose()
+
+    # If there are no examples then delete the example words block so it doesn't consume space
+    if not soup.find_all('div', {"class": "wordblock"}):
+        for example in soup.find_all('div', {"class": "examples"}):
+            example.decompose()
+
+    for a in soup.findAll('a'):
+
+        if "href" in a.attrs:
+            # If the character reference is actually a word_to_process, send us to mdbg instead
+            if "character" in a['href'] and len(a['href'].replace('/character/', "")) > 1:
+                a['href'] = "https://www.mdbg.net/chinese/dictionary?page=worddict&wdrst=1&wdqb=" + \
+                            a['href'].split('/')[2]
+            else:
+                # The links start is relative. We want them to be FQDNs so they reach out to Hanzicraft
+                a['href'] = "https://hanzicraft.com" + a['href']
+
+            # Remove target because it causes the links to fail.
+            if "target" in a.attrs:
+                a.attrs.pop("target")
+
+    import htmlmin
+
+    with metrics.stage("minify"):
+        return htmlmin.minify(str(soup), remove_empty_space=True, remove_comments=True,
+                              remove_optional_attribute_quotes=True)
+
+
+class CharacterRegistry:
+    """
+    Per-run registry of processed hanzicraft pages. Any number of threads may ask for pages at once. The first thread
+    to ask for a page fetches and processes it while any others asking for the same page wait for its result.
+    """
+
+    def __init__(self, fetch_page, process_page=process_hanzicraft_page):
+        """
+        :param fetch_page: A function taking the characters to look up and returning the raw hanzicraft page source.
+                           It must be safe to call from several threads at once.
+        :param process_page: A function turning the raw page into the finished HTML. Defaults to
+                             process_hanzicraft_page run on the calling thread.
+        """
+        self.fetch_page = fetch_page
+        self.process_page = process_page
+        self.pages_fetched = 0
+
+        self._pages = {}  # type: dict
+        self._lock = threading.Lock()
+
+    def get(self, characters):
+        """
+        Gets the processed hanzicraft HTML for some characters
+
+        :param str characters: The characters to look up. Ex: 間
+        :return: Returns the minified HTML for the Characters field
+        :rtype: str
+        """
+
+        with self._lock:
+            page = self._pages.get(characters)
+            owner = page is None
+            if owner:
+                page = Future()
+                self._pages[characters] = page
+                self.pages_fetched = self.pages_fetched + 1
+
+        if owner:
+            try:
+                page.set_result(self.process_page(self.fetch_page(characters)))
+            except BaseException as e:
+                # Let the next caller try again rather than handing the failure to every entry that shares this page
+                with self._lock:
+                    del self._pages[characters]
+                page.set_exception(e)
+
+        return page.result()
@@ -0,0 +1,207 @@
+"""
+Client for the character server's /api/lookup endpoint which provides the history of each character. Every character
+is only ever asked about once per run. Lookups go over a pooled session and when we know the characters we need up
+front they are resolved together, in one batch request if the server supports it and in bounded parallel single
+requests if it doesn't.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures.thread import ThreadPoolExecutor
+
+import metrics
+import request_scheduler
+
+BATCH_SIZE = 100
+TIMEOUT = 30
+
+
+class HistoryUnavailable(Exception):
+    """
+    Raised when the character server couldn't be asked about a character, as opposed to not knowing it
+    """
+    pass
+
+
+class HistoryClient:
+    """
+    Memoizing client for the history API. It is safe to share one instance between threads.
+    """
+
+    def __init__(self, api_address, max_workers=8, cache=None):
+        """
+        :param str api_address: The address of the character server. Ex: 127.0.0.1:5000
+        :param int max_workers: The most single character lookups in flight at once
+        :param response_cache.ResponseCache cache: If provided, answers are also kept in the persistent cache
+        """
+        self.url = "http://" + api_address + "/api/lookup"
+        self.max_workers = max_workers
+        self.cache = cache
+        self.requests_made = 0
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount("http://", adapter)
+
+        self._results = {}  # type: dict
+        self._lock = threading.Lock()
+
+        # None until we have tried a batch request and found out whether the server understands it
+        self._batch_supported = None  # type: bool
+
+    def _put(self, characters):
+        with self._lock:
+            self.requests_made = self.requests_made + 1
+        with metrics.stage("history_request"):
+            r = request_scheduler.call("history", lambda: self._session.put(
+                self.url, data=json.dumps({"characters_to_lookup": characters}),
+                headers={'Content-Type': 'application/json'}, timeout=TIMEOUT))
+        metrics.increment("history_bytes", len(r.content))
+        return r
+
+    def _remember(self, character, explanation):
+        with self._lock:
+            self._results[character] = explanation
+        if self.cache is not None:
+            self.cache.put("history", self.url + " " + character, json.dumps(explanation))
+
+    def _fetch_one(self, character):
+        """
+        Asks for a single character. If the request fails the character is left unresolved so a later lookup tries
+        again.
+
+        :return: Returns the explanation or None if the server doesn't know the character
+        :rtype: str
+        :raises HistoryUnavailable: If the server couldn't be asked or its answer made no sense
+        """
+        import requests
+
+        try:
+            r = self._put(character)
+
+            if r.status_code == 404:
+                explanation = None
+            else:
+                r.raise_for_status()
+                explanation = r.json()[0]["explanation"]
+        except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+            logging.warning("Couldn't get the history of " + character + " from " + self.url + ": " + str(e))
+            raise HistoryUnavailable(character) from e
+
+        self._remember(character, explanation)
+        return explanation
+
+    def _fetch_batch(self, characters):
+        """
+        Asks for several characters in one request. A server that supports this answers with one result per
+        character found, each naming its character. Anything else means we can't use batches.
+
+        :return: Returns True if the batch was answered, False if the server doesn't support batches and None if the
+                 request failed, in which case the characters are left unresolved
+        :rtype: bool
+        """
+        import requests
+
+        try:
+            r = self._put("".join(characters))
+        except requests.RequestException as e:
+            logging.warning("Couldn't get the history of " + str(len(characters)) + " characters from " + self.url +
+                            ": " + str(e))
+            return None
+
+        if r.status_code != 200:
+            return False
+
+        try:
+            results = r.json()
+            explanations = {result["character"]: result["explanation"] for result in results}
+        except (ValueError, KeyError, TypeError):
+            return False
+
+        if not set(explanations) <= set(characters):
+            return False
+
+        for character in characters:
+            self._remember(character, explanations.get(character))
+
+        return True
+
+    def _from_cache(self, character):
+        if self.cache is None:
+            return False
+
+        cached = self.cache.get("history", self.url + " " + character)
+        if cached is None:
+            return False
+
+        with self._lock:
+            self._results[character] = json.loads(cached)
+        return True
+
+    def prefetch(self, characters):
+        """
+        Resolves every character we haven't seen before so that later calls to lookup are free
+
+        :param characters: The characters that will be looked up. Duplicates are fine.
+        :return: Returns nothing
+        """
+
+        missing = [character for character in dict.fromkeys(characters)
+                   if character not in self._results and not self._from_cache(character)]
+
+        if not missing:
+            return
+
+        logging.info("Looking up the history of " + str(len(missing)) + " characters.")
+
+        if self._batch_supported is not False:
+            for start in range(0, len(missing), BATCH_SIZE):
+                answered = self._fetch_batch(missing[start:start + BATCH_SIZE])
+
+                if answered is None:
+                    # The server can't be reached. Leave the rest for lookup to try as each word needs them.
+                    return
+
+                if not answered:
+                    logging.info("The history API doesn't support batch lookups. Looking characters up one at a "
+                                 "time.")
+                    self._batch_supported = False
+                    break
+                self._batch_supported = True
+
+        missing = [character for character in missing if character not in self._results]
+
+        def fetch_one(character):
+            # Already logged. lookup asks again and reports the failure to whoever needs the character.
+            try:
+                self._fetch_one(character)
+            except HistoryUnavailable:
+                pass
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for _ in executor.map(fetch_one, missing):
+                    pass
+
+    def lookup(self, character):
+        """
+        Gets the history of a single character
+
+        :param str character: The character to look up
+        :return: Returns the explanation of the character or None if the server doesn't know it
+        :rtype: str
+        :raises HistoryUnavailable: If the server couldn't be asked
+        """
+
+        with self._lock:
+            if character in self._results:
+                return self._results[character]
+
+        if self._from_cache(character):
+            return self._results[character]
+
+        return self._fetch_one(character)
@@ -0,0 +1,199 @@
+"""
+The HTML parsing layer shared by the MDBG, hanzicraft and Naver scrapers. Each extractor only builds the part of the
+page it actually needs, using a SoupStrainer, and the parser BeautifulSoup uses underneath can be switched to a faster
+one like lxml with --html-parser. Every backend produces identical entries and examples.
+"""
+
+import logging
+
+import conversion
+
+PARSERS = ["html.parser", "lxml"]
+
+_parser = "html.parser"
+
+# bs4 is only imported, and the strainers built, the first time a page is parsed
+_strainers = None  # type: dict
+
+
+def strainer(name):
+    """
+    :param str name: One of mdbg_rows, hanzicraft_display or naver_example_lists
+    :return: Returns the SoupStrainer picking out the part of the page that extractor needs
+    :rtype: bs4.SoupStrainer
+    """
+    global _strainers
+
+    if _strainers is None:
+        from bs4 import SoupStrainer
+
+        _strainers = {"mdbg_rows": SoupStrainer("tr", {"class": "row"}),
+                      "hanzicraft_display": SoupStrainer(id="display"),
+                      "naver_example_lists": SoupStrainer("div", {"class": "example_lst"})}
+
+    return _strainers[name]
+
+
+def set_parser(parser):
+    """
+    Chooses the parser BeautifulSoup uses. If lxml is asked for but isn't installed we stay on html.parser.
+
+    :param str parser: One of PARSERS
+    :return: Returns the parser actually in use
+    :rtype: str
+    """
+    global _parser
+
+    if parser not in PARSERS:
+        raise ValueError("Unknown HTML parser " + parser + ". Choose one of " + ", ".join(PARSERS) + ".")
+
+    if parser == "lxml":
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            logging.warning("lxml isn't installed. Falling back to html.parser.")
+            parser = "html.parser"
+
+    _parser = parser
+    return _parser
+
+
+def make_soup(html, parse_only=None):
+    """
+    Parses HTML with the selected parser
+
+    :param str html: The HTML to parse
+    :param bs4.SoupStrainer parse_only: If provided, only the matching parts of the page are built
+    :return: Returns the parsed document
+    :rtype: bs4.BeautifulSoup
+    """
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(html, _parser, parse_only=parse_only)
+
+
+def mdbg_rows(html):
+    """
+    :param str html: A www.mdbg.net results page
+    :return: Returns each result row
+    :rtype: bs4.element.ResultSet
+    """
+    return make_soup(html, strainer("mdbg_rows")).find_all("tr", {"class": "row"})
+
+
+def parse_word_entry(entry):
+    """
+    Processes a single row from www.mbdg.net and returns it in a dictionary. This only pulls out what is on the MDBG
+    page itself (traditional, simplified, pinyin, defs and hsk) which is all the selection logic in process_word needs.
+    The expensive hanzicraft and history lookups are left to enrich_word_entry so we only pay for them on the entries
+    we actually keep.
+
+    :param bs4.element.Tag entry: This is equivalent to one row in the results from www.mdbg.net
+    :return: Returns a dictionary containing the parsed row
+    :rtype: dict
+    """
+
+    organized_entry = {"characters": []}  # type: dict
+
+    organized_entry. \
+        update({"traditional": entry.find("td", {"class": "head"}).find("div", {"class": "hanzi"}).text})
+
+    # I didn't investigate why, but for some reason the site was adding u200b so I just manually stripped that
+    # whitespace out.
+    organized_entry. \
+        update({"pinyin": str(entry.find("div", {"class": "pinyin"}).text).lower().strip().replace(u'\u200b', "")})
+
+    # The entries come separated by /'s which is why we have the split here
+    # The map function here just gets rid of the extra whitespace on each word_to_process before assignment
+    organized_entry. \
+        update({"defs": list(map(str.strip, str(entry.find("div", {"class": "defs"}).text).split('/')))})
+
+    tail = entry.find("td", {"class": "tail"})
+    simplified = tail.find("div", {"class": "hanzi"})  # type: bs4.element.Tag
+    hsk = tail.find("div", {"class": "hsk"})  # type: bs4.element.Tag
+
+    if simplified is not None:
+        organized_entry.update({"simplified": simplified.text})
+    else:
+        organized_entry.update({"simplified": ""})
+
+    if hsk is not None:
+        organized_entry.update({"hsk": hsk.text})
+    else:
+        organized_entry.update({"hsk": ""})
+
+    if organized_entry["simplified"].strip() == "":
+        organized_entry["simplified"] = conversion.to_simplified(organized_entry["traditional"])
+
+    return organized_entry
+
+
+def parse_mdbg_entries(html):
+    """
+    :param str html: A www.mdbg.net results page
+    :return: Returns every row of the page as parsed by parse_word_entry
+    :rtype: list of dicts
+    """
+    return [parse_word_entry(entry) for entry in mdbg_rows(html)]
+
+
+def hanzicraft_display(html):
+    """
+    :param str html: A hanzicraft.com character page
+    :return: Returns the #display block holding the character breakdowns
+    :rtype: bs4.element.Tag
+    """
+    return make_soup(html, strainer("hanzicraft_display")).find(id="display")
+
+
+def naver_example_lists(html):
+    """
+    :param str html: A rendered Naver example page
+    :return: Returns every div with class example_lst. There should only ever be one.
+    :rtype: bs4.element.ResultSet
+    """
+    return make_soup(html, strainer("naver_example_lists")).find_all("div", {"class": "example_lst"})
+
+
+def parse_naver_example(example, word):
+    """
+    Pulls a single example out of a Naver example list
+
+    :param bs4.element.Tag example: One li from the example list
+    :param str word: The word the examples are for. It is highlighted in the sentence.
+    :return: Returns a (chinese_sentence, pinyin, translation) tuple
+    :rtype: tuple
+    """
+
+    data = example.find("div", {"class": "exam"})
+
+    chinese_sentence = data.find("p", {"class": "stc"}).text.split(" ")
+    del chinese_sentence[-2:]
+    chinese_sentence = "".join(chinese_sentence).replace(word, "<em class=\"highlight\">" + word + "</em>")
+
+    # I know the way I did this is gross. Sue me.
+    pinyin = str(data.find("p", {"class": "pinyin"})).replace("<p class=\"pinyin\">", "").replace("</p>", "") \
+        .replace("hl", "highlight")
+    translation = data.find("p", {"class": "trans"}).text
+
+    return chinese_sentence, pinyin, translation
+
+
+def parse_naver_page(html, word):
+    """
+    Pulls every example out of a rendered Naver example page. Module level and free of soup objects in its result so
+    it can run in a cpu_pool worker.
+
+    :param str html: A rendered Naver example page
+    :param str word: The word the examples are for. It is highlighted in the sentence.
+    :return: Returns a list of (chinese_sentence, pinyin, translation) tuples in page order or None if the page had
+             more than one example list
+    :rtype: list
+    """
+
+    results = naver_example_lists(html)
+
+    if len(results) > 1:
+        return None
+
+    return [parse_naver_example(example, word) for example in results[0].find_all("li")]
@@ -0,0 +1,205 @@
+"""
+The long lived lookup service started by --run-server. Everything expensive (browser and HTTP connection pools, the
+response cache, the hanzicraft registry, the compiled examples template) is set up once when the process starts and
+reused by every request so only the first lookup pays the cold start.
+
+Endpoints, all answering JSON:
+
+    GET  /word?word=着急                    The selected entries for a word with their examples and finished card
+    POST /batch  {"words": ["着急", ...]}    The same for several words, looked up concurrently
+    GET  /examples?word=着急&pinyin=zháojí   Only the rendered examples for a word
+    GET  /health                            {"status": "ok"}
+
+Every request is bounded by a timeout. A batch answers with whatever finished in time and marks the rest as timed out.
+A request we can't make sense of is answered with 400, a word with no usable match with 404 and anything going wrong
+during the lookup itself with 500.
+"""
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+from urllib.parse import urlparse, parse_qs
+
+import metrics
+
+DEFAULT_TIMEOUT = 60
+
+# There is no authentication so only this machine can reach the service unless asked otherwise
+DEFAULT_HOST = "127.0.0.1"
+MAX_BATCH_SIZE = 500
+
+
+class BadRequest(Exception):
+    """
+    Raised while reading a request that doesn't make sense. Answered with 400.
+    """
+    pass
+
+
+class NotFound(Exception):
+    """
+    Raised by the lookup functions when a word has no match they can use. Answered with 404.
+    """
+    pass
+
+
+class LookupServer:
+    """
+    Serves word lookups over HTTP. The work itself is done by the functions handed in so the server knows nothing
+    about MDBG, hanzicraft or Naver.
+    """
+
+    def __init__(self, lookup_word, get_examples, port=5000, max_workers=5, timeout=DEFAULT_TIMEOUT,
+                 host=DEFAULT_HOST):
+        """
+        :param lookup_word: A function taking a word and returning a JSON serializable result for it. It raises
+                            NotFound if there is nothing to return.
+        :param get_examples: A function taking a word and its pinyin and returning the rendered examples
+        :param int port: The port to listen on
+        :param int max_workers: The most words being looked up at once across all requests
+        :param float timeout: The default number of seconds a request may take
+        :param str host: The address to listen on. 0.0.0.0 listens on every interface.
+        """
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        self.lookup_word = lookup_word
+        self.get_examples = get_examples
+        self.timeout = timeout
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.handle(self, "GET")
+
+            def do_POST(self):
+                server.handle(self, "POST")
+
+            def log_message(self, message_format, *message_args):
+                logging.debug("%s - %s" % (self.address_string(), message_format % message_args))
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self._server.server_port
+
+    def serve_forever(self):
+        logging.info("Serving lookups on port " + str(self.port) + ".")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._server.shutdown()
+
+    def _request_timeout(self, query, body=None):
+        timeout = (body or {}).get("timeout", query.get("timeout", [self.timeout])[0])
+        try:
+            return min(float(timeout), self.timeout)
+        except (ValueError, TypeError):
+            raise BadRequest("The timeout must be a number of seconds.")
+
+    def _word(self, word, timeout):
+        future = self._executor.submit(self.lookup_word, word)
+        try:
+            return 200, future.result(timeout=timeout)
+        except NotFound as e:
+            return 404, {"word": word, "error": str(e)}
+        except TimeoutError:
+            future.cancel()
+            return 504, {"word": word, "error": "Timed out after " + str(timeout) + " seconds."}
+
+    def _batch(self, words, timeout):
+        futures = [self._executor.submit(self.lookup_word, word) for word in words]
+        done, not_done = wait(futures, timeout=timeout)
+
+        results = []
+        for word, future in zip(words, futures):
+            if future in done:
+                exception = future.exception()
+                if exception is None:
+                    results.append(future.result())
+                else:
+                    results.append({"word": word, "error": str(exception)})
+            else:
+                future.cancel()
+                results.append({"word": word, "error": "Timed out after " + str(timeout) + " seconds."})
+
+        return 200, {"results": results}
+
+    def _examples(self, word, word_pinyin, timeout):
+        future = self._executor.submit(self.get_examples, word, word_pinyin)
+        try:
+            return 200, {"word": word, "pinyin": word_pinyin, "examples": future.result(timeout=timeout)}
+        except TimeoutError:
+            future.cancel()
+            return 504, {"word": word, "error": "Timed out after " + str(timeout) + " seconds."}
+
+    def route(self, method, request_path, query, body):
+        """
+        :return: Returns a tuple of (HTTP status, JSON serializable response)
+        """
+
+        if method == "GET" and request_path == "/health":
+            return 200, {"status": "ok"}
+
+        if method == "GET" and request_path == "/word":
+            if "word" not in query:
+                return 400, {"error": "The word parameter is required."}
+            return self._word(query["word"][0].strip(), self._request_timeout(query))
+
+        if method == "POST" and request_path == "/batch":
+            try:
+                request = json.loads(body or "{}")
+                words = [word.strip() for word in request["words"] if word.strip()]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return 400, {"error": "The body must be JSON like {\"words\": [\"着急\", ...]}."}
+            if len(words) > MAX_BATCH_SIZE:
+                return 400, {"error": "At most " + str(MAX_BATCH_SIZE) + " words may be sent in one batch."}
+            return self._batch(words, self._request_timeout(query, request))
+
+        if method == "GET" and request_path == "/examples":
+            if "word" not in query or "pinyin" not in query:
+                return 400, {"error": "The word and pinyin parameters are required."}
+            return self._examples(query["word"][0].strip(), query["pinyin"][0].strip(), self._request_timeout(query))
+
+        return 404, {"error": "Unknown endpoint " + method + " " + request_path}
+
+    def handle(self, handler, method):
+        started = time.perf_counter()
+
+        parsed = urlparse(handler.path)
+
+        try:
+            try:
+                length = int(handler.headers.get("Content-Length") or 0)
+                body = handler.rfile.read(length).decode("utf-8") if length else ""
+            except ValueError:
+                raise BadRequest("The body must be UTF-8 with a valid Content-Length.")
+
+            # Errors from the lookup itself, like a bad answer from MDBG, are ours rather than the client's
+            status, response = self.route(method, parsed.path, parse_qs(parsed.query), body)
+        except BadRequest as e:
+            status, response = 400, {"error": str(e)}
+        except Exception as e:
+            logging.exception("Failed to answer " + handler.path)
+            status, response = 500, {"error": str(e)}
+
+        encoded = json.dumps(response, ensure_ascii=False).encode("utf-8")
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Content-Length", str(len(encoded)))
+        handler.end_headers()
+        handler.wfile.write(encoded)
+
+        metrics.observe("server_request_seconds", time.perf_counter() - started)
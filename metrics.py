@@ -0,0 +1,229 @@
+"""
+Per-stage timings and counters for a run. Each stage worth knowing about (MDBG fetches, hanzicraft page loads,
+history API calls, HTML parsing, minification, Naver pagination, ...) is wrapped in a timer and bumps counters such as
+bytes fetched or retries. At the end of the run a summary is printed and, with --metrics-out, written out as JSON or
+in the Prometheus textfile format.
+
+Nothing is recorded until enable is called. While disabled, stage returns a shared no-op context manager and the other
+functions return straight away so the instrumentation costs next to nothing.
+"""
+
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+enabled = False
+
+_lock = threading.Lock()
+_timings = {}  # type: dict
+_values = {}  # type: dict
+_counters = {}  # type: dict
+
+_disabled = nullcontext()
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def enable():
+    """
+    Turns recording on
+
+    :return: Returns nothing
+    """
+    global enabled
+    enabled = True
+
+
+def reset():
+    """
+    Throws away everything recorded so far
+
+    :return: Returns nothing
+    """
+    with _lock:
+        _timings.clear()
+        _values.clear()
+        _counters.clear()
+
+
+class _Timer:
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        elapsed = time.perf_counter() - self.started
+        with _lock:
+            _timings.setdefault(self.name, []).append(elapsed)
+        return False
+
+
+def stage(name):
+    """
+    Times a stage. Use it as a context manager:
+
+        with metrics.stage("mdbg_fetch"):
+            html = urlopen(url_string).read()
+
+    :param str name: The name of the stage
+    :return: Returns a context manager which records how long its block took
+    """
+    if not enabled:
+        return _disabled
+    return _Timer(name)
+
+
+def record(name, seconds):
+    """
+    Records a stage time measured somewhere a timer can't reach, like a worker process
+
+    :param str name: The name of the stage
+    :param float seconds: How long it took
+    :return: Returns nothing
+    """
+    if not enabled:
+        return
+    with _lock:
+        _timings.setdefault(name, []).append(seconds)
+
+
+def increment(name, amount=1):
+    """
+    Adds to a counter
+
+    :param str name: The name of the counter. Ex: mdbg_bytes
+    :param int amount: How much to add
+    :return: Returns nothing
+    """
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name, value):
+    """
+    Records one value of something we want the distribution of, like the number of Naver pages visited for a word
+
+    :param str name: The name of the distribution
+    :param float value: The value
+    :return: Returns nothing
+    """
+    if not enabled:
+        return
+    with _lock:
+        _values.setdefault(name, []).append(value)
+
+
+def _quantile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _describe(values):
+    ordered = sorted(values)
+    description = {"count": len(ordered), "total": sum(ordered), "max": ordered[-1]}
+    for fraction in QUANTILES:
+        description["p" + str(int(fraction * 100))] = _quantile(ordered, fraction)
+    return description
+
+
+def snapshot():
+    """
+    :return: Returns everything recorded so far. Stage times are in seconds.
+    :rtype: dict
+    """
+    with _lock:
+        timings = {name: list(values) for name, values in _timings.items()}
+        values = {name: list(observed) for name, observed in _values.items()}
+        counters = dict(_counters)
+
+    return {"stages": {name: _describe(timings[name]) for name in sorted(timings)},
+            "distributions": {name: _describe(values[name]) for name in sorted(values)},
+            "counters": {name: counters[name] for name in sorted(counters)}}
+
+
+def summary():
+    """
+    :return: Returns a human readable table of everything recorded so far
+    :rtype: str
+    """
+
+    recorded = snapshot()
+    lines = ["%-24s %8s %10s %9s %9s %9s" % ("Stage", "Count", "Total s", "p50 ms", "p95 ms", "p99 ms")]
+
+    for name, description in recorded["stages"].items():
+        lines.append("%-24s %8d %10.2f %9.1f %9.1f %9.1f" %
+                     (name, description["count"], description["total"], description["p50"] * 1000,
+                      description["p95"] * 1000, description["p99"] * 1000))
+
+    for name, description in recorded["distributions"].items():
+        lines.append("%-24s %8d    mean %.2f, p50 %g, p95 %g, max %g" %
+                     (name, description["count"], description["total"] / description["count"], description["p50"],
+                      description["p95"], description["max"]))
+
+    for name, value in recorded["counters"].items():
+        lines.append("%-24s %8d" % (name, value))
+
+    return "\n".join(lines)
+
+
+def to_prometheus(recorded, prefix="flashcard_"):
+    """
+    Formats a snapshot in the Prometheus text exposition format, suitable for the node exporter's textfile collector
+
+    :param dict recorded: A snapshot as returned by snapshot
+    :param str prefix: Put in front of every metric name
+    :return: Returns the text
+    :rtype: str
+    """
+
+    lines = []
+
+    if recorded["stages"]:
+        lines.append("# TYPE " + prefix + "stage_seconds summary")
+        for name, description in recorded["stages"].items():
+            for fraction in QUANTILES:
+                lines.append(prefix + "stage_seconds{stage=\"" + name + "\",quantile=\"" + str(fraction) + "\"} " +
+                             repr(description["p" + str(int(fraction * 100))]))
+            lines.append(prefix + "stage_seconds_sum{stage=\"" + name + "\"} " + repr(description["total"]))
+            lines.append(prefix + "stage_seconds_count{stage=\"" + name + "\"} " + str(description["count"]))
+
+    for name, description in recorded["distributions"].items():
+        lines.append("# TYPE " + prefix + name + " summary")
+        for fraction in QUANTILES:
+            lines.append(prefix + name + "{quantile=\"" + str(fraction) + "\"} " +
+                         repr(description["p" + str(int(fraction * 100))]))
+        lines.append(prefix + name + "_sum " + repr(description["total"]))
+        lines.append(prefix + name + "_count " + str(description["count"]))
+
+    for name, value in recorded["counters"].items():
+        lines.append("# TYPE " + prefix + name + "_total counter")
+        lines.append(prefix + name + "_total " + str(value))
+
+    return "\n".join(lines) + "\n"
+
+
+def write(metrics_file):
+    """
+    Writes everything recorded so far to a file. Files ending in .prom are written in the Prometheus textfile format
+    and anything else as JSON.
+
+    :param str metrics_file: The path to write to
+    :return: Returns nothing
+    """
+
+    recorded = snapshot()
+
+    with open(metrics_file, 'w', encoding="utf-8") as output_file:
+        if metrics_file.endswith(".prom"):
+            output_file.write(to_prometheus(recorded))
+        else:
+            json.dump(recorded, output_file, indent=2)
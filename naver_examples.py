@@ -0,0 +1,232 @@
+"""
+Browser-free backend for the Naver example sentences. The linedict page at
+https://dict.naver.com/linedict/zhendict/dict.html#/cnen/example?query=... is a single page app which fills itself in
+from a JSON search endpoint. Rather than rendering the whole thing in Chrome we ask that endpoint directly.
+
+A page of results looks like:
+
+    {"exampleList": [{"example": "我<strong>着</strong>急", "pinyin": "wǒ <strong>zháo</strong> jí",
+                      "translation": "I'm worried"}, ...]}
+
+and paging is done with the page query parameter. An empty exampleList means we have run out of pages.
+
+Words whose pinyin filter rejects most sentences can need many pages so the next few pages are fetched ahead of time
+while the current one is being read. Pages are still consumed strictly in order, so the examples come out exactly as if
+they had been fetched one after another, and whatever is still queued is cancelled once we have enough.
+"""
+
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import metrics
+import request_scheduler
+
+NAVER_EXAMPLE_API = "https://dict.naver.com/linedict/cnen/example/search.dict"
+PAGE_SIZE = 20
+TIMEOUT = 10
+DEFAULT_PREFETCH = 3
+
+_session = None  # type: requests.Session
+_session_lock = threading.Lock()
+
+_page_executor = None  # type: ThreadPoolExecutor
+
+_highlight = re.compile(r"<(strong|b|em)(\s[^>]*)?>(.*?)</\1>", re.DOTALL)
+_tags = re.compile(r"<[^>]+>")
+
+
+def get_session(pool_size=10):
+    """
+    Returns the requests session shared by every thread fetching examples so connections to Naver are reused
+
+    :param int pool_size: The number of connections to keep open. Only used the first time this is called.
+    :return: Returns the shared session
+    :rtype: requests.Session
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def get_page_executor(workers=10):
+    """
+    Returns the thread pool shared by every word for fetching pages ahead of time
+
+    :param int workers: The most pages being fetched at once. Only used the first time this is called.
+    :return: Returns the shared pool
+    :rtype: ThreadPoolExecutor
+    """
+    global _page_executor
+
+    with _session_lock:
+        if _page_executor is None:
+            _page_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="naver-page")
+        return _page_executor
+
+
+def fetch_example_page(word, page, base_url=NAVER_EXAMPLE_API, session=None):
+    """
+    Fetches one page of example sentences for a word
+
+    :param str word: The word for which you want examples
+    :param int page: The page number, starting from 1
+    :param str base_url: The search endpoint. Overridden to point at a stub server when testing.
+    :param requests.Session session: The session to use. Defaults to the shared session.
+    :return: Returns the decoded JSON for the page
+    :rtype: dict
+    """
+
+    if session is None:
+        session = get_session()
+
+    with metrics.stage("naver_fetch"):
+        r = request_scheduler.call("naver", lambda: session.get(base_url, params={
+            "query": word, "page": page, "page_size": PAGE_SIZE, "examType": "normal", "format": "json",
+            "platform": "isPC"}, timeout=TIMEOUT))
+    r.raise_for_status()
+    metrics.increment("naver_bytes", len(r.content))
+
+    return r.json()
+
+
+def highlight_pinyin(raw_pinyin):
+    """
+    Converts the highlighted syllables in Naver's pinyin to the highlight spans examples.html.j2 expects and strips
+    any other markup
+
+    :param str raw_pinyin: The pinyin as it came back from Naver
+    :return: Returns the pinyin with the matched syllables wrapped in <span class="highlight">
+    :rtype: str
+    """
+
+    parts = []
+    last = 0
+
+    for match in _highlight.finditer(raw_pinyin):
+        parts.append(_tags.sub("", raw_pinyin[last:match.start()]))
+        parts.append("<span class=\"highlight\">" + _tags.sub("", match.group(3)) + "</span>")
+        last = match.end()
+
+    parts.append(_tags.sub("", raw_pinyin[last:]))
+
+    return "".join(parts)
+
+
+def parse_example_page(data, word, word_pinyin):
+    """
+    Turns a page from fetch_example_page into the same tuples the Selenium scraper produces
+
+    :param dict data: A page as returned by fetch_example_page
+    :param str word: The word the examples are for. It is highlighted in each sentence.
+    :param str word_pinyin: Only examples whose pinyin contains this are kept
+    :return: Returns a list of (chinese_sentence, pinyin, translation) tuples
+    :rtype: list
+    """
+
+    examples = []
+
+    for example in data.get("exampleList") or []:
+
+        # The rendered page shows the sentence with its words separated by spaces which the scraper joins back
+        # together so we do the same here.
+        chinese_sentence = "".join(_tags.sub("", example.get("example", "")).split(" "))
+        chinese_sentence = chinese_sentence.replace(word, "<em class=\"highlight\">" + word + "</em>")
+
+        pinyin = highlight_pinyin(example.get("pinyin", ""))
+
+        translation = _tags.sub("", example.get("translation", ""))
+
+        if word_pinyin in pinyin:
+            examples.append((chinese_sentence, pinyin, translation))
+
+    return examples
+
+
+def _fetch_in_order(fetch, pages, prefetch):
+    """
+    Yields the result of fetch for each page, in order, while keeping up to prefetch fetches running ahead of the one
+    being read. Closing the generator cancels any fetch that hasn't started yet. Fetches already in flight are left
+    to finish and their results are dropped.
+
+    :param fetch: A function taking a page number and returning the page
+    :param pages: The page numbers to fetch
+    :param int prefetch: The most pages in flight at once. 1 fetches each page only when it is asked for.
+    :return: Yields each page
+    """
+
+    if prefetch <= 1:
+        for page in pages:
+            yield fetch(page)
+        return
+
+    executor = get_page_executor()
+    pages = iter(pages)
+    in_flight = deque(executor.submit(fetch, page) for page in islice(pages, prefetch))
+
+    try:
+        while in_flight:
+            data = in_flight.popleft().result()
+
+            next_page = next(pages, None)
+            if next_page is not None:
+                in_flight.append(executor.submit(fetch, next_page))
+
+            yield data
+    finally:
+        for future in in_flight:
+            if future.cancel():
+                metrics.increment("naver_prefetch_cancelled")
+
+
+def get_examples(word, word_pinyin, max_examples, max_page=20, base_url=NAVER_EXAMPLE_API, session=None,
+                 prefetch=DEFAULT_PREFETCH):
+    """
+    Walks the example pages for a word until we have enough matching examples or run out of pages
+
+    :param str word: The word for which you want examples
+    :param str word_pinyin: Only examples whose pinyin contains this are kept
+    :param int max_examples: Stop once this many examples have been collected
+    :param int max_page: The maximum number of pages in which to search for examples
+    :param str base_url: The search endpoint. Overridden to point at a stub server when testing.
+    :param requests.Session session: The session to use. Defaults to the shared session.
+    :param int prefetch: The most pages fetched at once. Pages after the one being read are fetched ahead of time.
+    :return: Returns a list of (chinese_sentence, pinyin, translation) tuples
+    :rtype: list
+    """
+
+    examples = []
+    pages_visited = 0
+
+    pages = _fetch_in_order(lambda page: fetch_example_page(word, page, base_url=base_url, session=session),
+                            range(1, max_page), prefetch)
+
+    try:
+        for data in pages:
+            pages_visited = pages_visited + 1
+
+            if not data.get("exampleList"):
+                break
+
+            with metrics.stage("naver_parse"):
+                examples.extend(parse_example_page(data, word, word_pinyin))
+
+            if len(examples) >= max_examples:
+                break
+    finally:
+        pages.close()
+
+    metrics.observe("naver_pages_per_word", pages_visited)
+
+    return examples[:max_examples]
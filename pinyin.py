@@ -0,0 +1,90 @@
+"""
+Helpers for converting numbered pinyin (shun4 jian1) into the tone marked form MDBG displays (shùnjiān).
+"""
+
+import re
+import unicodedata
+
+TONE_MARKS = {
+    "a": "āáǎàa",
+    "e": "ēéěèe",
+    "i": "īíǐìi",
+    "o": "ōóǒòo",
+    "u": "ūúǔùu",
+    "ü": "ǖǘǚǜü"
+}
+
+_syllable = re.compile(r"([A-Za-zÜü:]+)([0-5])")
+
+
+def mark_syllable(syllable, tone):
+    """
+    Puts the tone mark on a single pinyin syllable
+
+    :param str syllable: The syllable without its tone number. Ex: zhuang. ü may be written as u: or v.
+    :param int tone: The tone number. 5 and 0 mean the neutral tone.
+    :return: Returns the syllable with its tone mark. Ex: zhuàng
+    :rtype: str
+    """
+
+    syllable = syllable.replace("u:", "ü").replace("U:", "Ü").replace("v", "ü").replace("V", "Ü")
+
+    if tone in (0, 5):
+        return syllable
+
+    lower = syllable.lower()
+
+    # a and e always take the mark, as does the o in ou. Otherwise it goes on the last vowel.
+    if "a" in lower:
+        index = lower.index("a")
+    elif "e" in lower:
+        index = lower.index("e")
+    elif "ou" in lower:
+        index = lower.index("o")
+    else:
+        index = max(lower.rfind(vowel) for vowel in "iouü")
+        if index < 0:
+            # Syllables like m2 or ng2 have no vowel to mark
+            return syllable
+
+    marked = TONE_MARKS[lower[index]][tone - 1]
+    if syllable[index].isupper():
+        marked = marked.upper()
+
+    return syllable[:index] + marked + syllable[index + 1:]
+
+
+def numbered_to_marked(numbered):
+    """
+    Converts numbered pinyin into tone marked pinyin. Anything that isn't a numbered syllable is left alone.
+
+    :param str numbered: Ex: shun4 jian1
+    :return: Returns the tone marked pinyin. Ex: shùn jiān
+    :rtype: str
+    """
+    return _syllable.sub(lambda match: mark_syllable(match.group(1), int(match.group(2))), numbered)
+
+
+def to_mdbg_pinyin(numbered):
+    """
+    Converts numbered pinyin into the form process_word compares against. MDBG runs the syllables together and we
+    lower case them.
+
+    :param str numbered: Ex: Yue1 se4 fu1
+    :return: Returns the pinyin as it would come back from MDBG. Ex: yuēsèfū
+    :rtype: str
+    """
+    return numbered_to_marked(numbered).replace(" ", "").lower()
+
+
+def comparison_key(pinyin):
+    """
+    Reduces pinyin to a form in which the same reading always compares equal, however it was written. Numbered
+    syllables are tone marked and case, spaces, separable verb markers (//), hyphens and apostrophes are dropped.
+
+    :param str pinyin: Numbered or tone marked pinyin. Ex: Yue1se4fu1, lan2//lu4 or yuē sè fū
+    :return: Returns the key. Ex: yuēsèfū or lánlù
+    :rtype: str
+    """
+    marked = unicodedata.normalize("NFC", numbered_to_marked(pinyin.replace("//", "")))
+    return "".join(character for character in marked.lower() if character.isalpha())
@@ -0,0 +1,78 @@
+"""
+Renders the example blocks that go on the back of each card. examples.html.j2 is loaded and compiled once, through a
+shared Jinja Environment with a bytecode cache so later runs skip the compile too, and the compiled template is reused
+by every thread.
+"""
+
+import threading
+from os import path
+
+import metrics
+
+TEMPLATE_DIR = path.dirname(path.abspath(__file__))
+EXAMPLES_TEMPLATE = "examples.html.j2"
+
+_environment = None  # type: jinja2.Environment
+_examples_template = None
+_lock = threading.Lock()
+
+
+def get_environment():
+    """
+    Returns the shared Jinja environment, creating it the first time it is asked for
+
+    :return: Returns the environment
+    :rtype: jinja2.Environment
+    """
+    global _environment
+
+    with _lock:
+        if _environment is None:
+            from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+            _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR),
+                                       bytecode_cache=FileSystemBytecodeCache())
+        return _environment
+
+
+def get_examples_template():
+    """
+    Returns the compiled examples.html.j2
+
+    :return: Returns the template
+    :rtype: jinja2.Template
+    """
+    global _examples_template
+
+    if _examples_template is None:
+        template = get_environment().get_template(EXAMPLES_TEMPLATE)
+        with _lock:
+            _examples_template = template
+    return _examples_template
+
+
+def minify(html):
+    """
+    Minifies HTML so it fits on a single line of the flashcard file
+
+    :param str html: The HTML to minify
+    :return: Returns the minified HTML with no newlines in it
+    :rtype: str
+    """
+    import htmlmin
+
+    with metrics.stage("minify"):
+        return htmlmin.minify(html, remove_empty_space=True, remove_comments=True).replace("\n", "")
+
+
+def render_examples(examples):
+    """
+    Renders a list of examples into the block that goes on a card
+
+    :param list examples: A list of (chinese_sentence, pinyin, translation) tuples
+    :return: Returns the minified HTML for the examples
+    :rtype: str
+    """
+    with metrics.stage("examples_render"):
+        html = get_examples_template().render(examples=examples)
+    return minify(html)
@@ -0,0 +1,339 @@
+"""
+Every request we make to another site goes through here. There are four of them: MDBG, hanzicraft, Naver and the
+character server with the history API. Each host gets its own cap on requests in flight and, optionally, a token
+bucket limiting how many requests a second it sees, so raising --thread-count no longer multiplies the load on
+every site at once. Requests that time out, can't connect or come back 429 or 5xx are retried with exponential
+backoff and full jitter, honouring Retry-After when the server sends one.
+
+Like metrics, the scheduler is module level state. configure sets the limits once at startup and call is used from
+any thread:
+
+    page = request_scheduler.call("mdbg", lambda: urlopen(url).read())
+
+A function returning a requests response with a status worth retrying is retried the same way as one raising an
+exception. If it still fails after the last retry the response is returned so the caller can handle it as before.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import metrics
+
+HOSTS = ["mdbg", "hanzicraft", "naver", "history"]
+
+# (most requests in flight, most requests a second or None for no limit). These match how hard each host was hit
+# with the default --lookup-concurrency, --thread-count and --naver-prefetch before the scheduler existed.
+DEFAULT_LIMITS = {"mdbg": (8, None), "hanzicraft": (5, None), "naver": (15, None), "history": (8, None)}
+
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Exceptions worth retrying, by class name so that requests, urllib and selenium don't have to be imported here.
+# An exception matches if it or any of its base classes has one of these names.
+RETRY_EXCEPTIONS = {"TimeoutError", "ConnectionError", "Timeout", "URLError", "ChunkedEncodingError",
+                    "TimeoutException"}
+
+
+class _Host:
+    """
+    The limits and statistics for one host
+    """
+
+    def __init__(self, name, concurrency=None, rate=None):
+        """
+        :param str name: The host. One of HOSTS.
+        :param int concurrency: The most requests in flight at once or None for no limit
+        :param float rate: The most requests started a second or None for no limit. Up to one second's worth may be
+                           started at once after a quiet spell.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.rate = rate
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self._capacity = max(1.0, rate) if rate else None
+        self._tokens = self._capacity
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waited = 0.0
+        self.busy = 0.0
+
+    def _take_token(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+
+                if self._tokens >= 1:
+                    self._tokens = self._tokens - 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+    def acquire(self):
+        """
+        Waits for a free slot and then for a token
+
+        :return: Returns how many seconds we waited
+        :rtype: float
+        """
+
+        started = time.monotonic()
+
+        # A token is only taken once we have a slot so tokens aren't used up by requests that can't start yet
+        if self._slots is not None:
+            self._slots.acquire()
+        if self.rate:
+            self._take_token()
+
+        waited = time.monotonic() - started
+
+        with self._lock:
+            self.requests = self.requests + 1
+            self.in_flight = self.in_flight + 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.waited = self.waited + waited
+
+        return waited
+
+    def release(self, busy):
+        """
+        :param float busy: How many seconds the request took
+        :return: Returns nothing
+        """
+
+        with self._lock:
+            self.in_flight = self.in_flight - 1
+            self.busy = self.busy + busy
+
+        if self._slots is not None:
+            self._slots.release()
+
+    def record(self, retried=False, failed=False, throttled=False):
+        with self._lock:
+            if retried:
+                self.retries = self.retries + 1
+            if failed:
+                self.failures = self.failures + 1
+            if throttled:
+                self.throttled = self.throttled + 1
+
+    def stats(self):
+        """
+        :return: Returns the host's limits and statistics
+        :rtype: dict
+        """
+
+        with self._lock:
+            return {"concurrency": self.concurrency, "rate": self.rate, "requests": self.requests,
+                    "retries": self.retries, "failures": self.failures, "throttled": self.throttled,
+                    "peak_in_flight": self.peak_in_flight, "wait_s": round(self.waited, 3),
+                    "busy_s": round(self.busy, 3)}
+
+
+_hosts = {}  # type: dict
+_hosts_lock = threading.Lock()
+_max_retries = DEFAULT_MAX_RETRIES
+_backoff = DEFAULT_BACKOFF
+_max_backoff = DEFAULT_MAX_BACKOFF
+
+
+def parse_limit(limit):
+    """
+    :param str limit: A limit from the command line. Ex: naver=8 or naver=8:2.5
+    :return: Returns a tuple of (host, concurrency, rate). A concurrency of 0 means no limit. The rate is None if it
+             wasn't given.
+    :rtype: tuple
+    """
+
+    host, _, values = limit.partition("=")
+    host = host.strip()
+
+    if host not in HOSTS:
+        raise ValueError(host + " is not a host we talk to. Choose from " + ", ".join(HOSTS) + ".")
+
+    concurrency, _, rate = values.partition(":")
+    return host, int(concurrency), float(rate) if rate.strip() else None
+
+
+def configure(limits=None, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+              max_backoff=DEFAULT_MAX_BACKOFF):
+    """
+    Sets the limits and retry policy. Statistics start over.
+
+    :param list limits: Overrides for DEFAULT_LIMITS as tuples returned by parse_limit
+    :param int max_retries: How many times a request is retried before giving up
+    :param float backoff: The longest wait in seconds before the first retry. It doubles with each retry after that.
+    :param float max_backoff: The longest we will ever wait before a retry
+    :return: Returns nothing
+    """
+    global _max_retries, _backoff, _max_backoff
+
+    host_limits = dict(DEFAULT_LIMITS)
+    for host, concurrency, rate in limits or []:
+        host_limits[host] = (concurrency or None, rate)
+
+    with _hosts_lock:
+        _hosts.clear()
+        for host, (concurrency, rate) in host_limits.items():
+            _hosts[host] = _Host(host, concurrency, rate)
+
+    _max_retries = max_retries
+    _backoff = backoff
+    _max_backoff = max_backoff
+
+
+def _host(name):
+    host = _hosts.get(name)
+
+    if host is None:
+        with _hosts_lock:
+            if name not in _hosts:
+                concurrency, rate = DEFAULT_LIMITS.get(name, (None, None))
+                _hosts[name] = _Host(name, concurrency, rate)
+            host = _hosts[name]
+
+    return host
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _status(outcome):
+    """
+    :param outcome: A response or an exception
+    :return: Returns the HTTP status code carried by the response or exception and its headers, if there are any
+    :rtype: tuple
+    """
+
+    # requests responses and the response of a requests HTTPError
+    response = getattr(outcome, "response", None) if isinstance(outcome, Exception) else outcome
+    status = getattr(response, "status_code", None)
+    if isinstance(status, int):
+        return status, getattr(response, "headers", None)
+
+    # urllib's HTTPError
+    status = getattr(outcome, "code", None)
+    if isinstance(outcome, Exception) and isinstance(status, int):
+        return status, getattr(outcome, "headers", None)
+
+    return None, None
+
+
+def call(host, function, *args, retry_on=(), max_retries=None):
+    """
+    Makes a request to a host within its limits, retrying if it fails in a way worth retrying
+
+    :param str host: The host the request goes to. One of HOSTS.
+    :param function: Makes the request
+    :param args: The arguments for the function
+    :param tuple retry_on: Further exception classes to retry on. Ex: a page that didn't finish loading in Selenium.
+    :param int max_retries: Overrides the number of retries set with configure for this request
+    :return: Returns whatever the function returns
+    """
+
+    if max_retries is None:
+        max_retries = _max_retries
+
+    state = _host(host)
+    attempt = 0
+
+    while True:
+        waited = state.acquire()
+        metrics.observe(host + "_queue_ms", waited * 1000)
+
+        started = time.monotonic()
+        retry_after = None
+
+        try:
+            outcome = function(*args)
+        except Exception as exc:
+            status, headers = _status(exc)
+            if status is not None:
+                retry = status in RETRY_STATUSES
+            else:
+                retry = isinstance(exc, retry_on) or \
+                    any(cls.__name__ in RETRY_EXCEPTIONS for cls in type(exc).__mro__)
+
+            if status == 429:
+                state.record(throttled=True)
+            if headers is not None:
+                retry_after = _retry_after(headers)
+
+            if not retry or attempt >= max_retries:
+                state.record(failed=True)
+                metrics.increment(host + "_failures")
+                raise
+        else:
+            status, headers = _status(outcome)
+
+            if status not in RETRY_STATUSES:
+                return outcome
+
+            if status == 429:
+                state.record(throttled=True)
+            if headers is not None:
+                retry_after = _retry_after(headers)
+
+            if attempt >= max_retries:
+                state.record(failed=True)
+                metrics.increment(host + "_failures")
+                return outcome
+        finally:
+            state.release(time.monotonic() - started)
+
+        delay = random.uniform(0, min(_max_backoff, _backoff * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, _max_backoff))
+
+        attempt = attempt + 1
+        state.record(retried=True)
+        metrics.increment(host + "_retries")
+        logging.info("Request to " + host + " failed. Retrying in " + str(round(delay, 2)) + " seconds (retry " +
+                     str(attempt) + " of " + str(max_retries) + ").")
+
+        time.sleep(delay)
+
+
+def stats():
+    """
+    :return: Returns a dictionary of each host we made requests to and its statistics
+    :rtype: dict
+    """
+    return {name: host.stats() for name, host in list(_hosts.items()) if host.requests}
+
+
+def summary():
+    """
+    :return: Returns the per host statistics as a table
+    :rtype: str
+    """
+
+    lines = ["%-12s %8s %8s %8s %9s %9s %10s %10s" % ("host", "requests", "retries", "failed", "throttled",
+                                                       "peak", "wait s", "busy s")]
+
+    for name, host in sorted(stats().items()):
+        lines.append("%-12s %8d %8d %8d %9d %9d %10.2f %10.2f" % (name, host["requests"], host["retries"],
+                                                                  host["failures"], host["throttled"],
+                                                                  host["peak_in_flight"], host["wait_s"],
+                                                                  host["busy_s"]))
+
+    return "\n".join(lines)
@@ -0,0 +1,222 @@
+"""
+A persistent, content-addressed cache for everything we pull off of the network. Responses are stored in a SQLite
+database keyed by the source they came from (mdbg, hanzicraft, history, naver) and the normalized query used to get
+them. Each source has its own time to live and the database as a whole is capped in size with the least recently used
+responses evicted first.
+
+Reads don't write to the database. When each response was last used is kept in memory and written out in batches,
+before anything is evicted, every ACCESS_BATCH_SIZE reads and when the cache is closed, so a rerun answered entirely
+from the cache doesn't pay for a commit per lookup.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from os import path, makedirs
+
+DAY = 24 * 60 * 60
+
+# How long, in seconds, a response from each source is considered good. The dictionary and character data almost
+# never changes so there's no reason to go back for it often.
+DEFAULT_TTLS = {
+    "mdbg": 30 * DAY,
+    "hanzicraft": 90 * DAY,
+    "history": 30 * DAY,
+    "naver": 30 * DAY
+}
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+ACCESS_BATCH_SIZE = 1000
+
+
+def normalize_query(query):
+    """
+    Normalizes a query so that trivially different versions of the same lookup share a cache entry
+
+    :param str query: The query as it was passed to the source
+    :return: Returns the normalized query
+    :rtype: str
+    """
+    return unicodedata.normalize("NFC", query.strip())
+
+
+def make_key(source, query):
+    """
+    Creates the content address for a given source and query
+
+    :param str source: The name of the source. Ex: mdbg
+    :param str query: The query sent to the source
+    :return: Returns a hex digest uniquely identifying the source/query pair
+    :rtype: str
+    """
+    return hashlib.sha256((source + "\0" + normalize_query(query)).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite backed response cache. It is safe to share one instance between threads.
+    """
+
+    def __init__(self, cache_dir, ttls=None, max_size=DEFAULT_MAX_SIZE, refresh=False):
+        """
+        :param str cache_dir: The directory in which the cache database should live. It is created if it is missing.
+        :param dict ttls: Overrides for DEFAULT_TTLS. Maps a source name to its time to live in seconds.
+        :param int max_size: The maximum size of all cached responses in bytes. Past this we start evicting.
+        :param bool refresh: If true, existing entries are ignored and overwritten with fresh responses.
+        """
+        makedirs(cache_dir, exist_ok=True)
+
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_size = max_size
+        self.refresh = refresh
+        self.hits = {}  # type: dict
+        self.misses = {}  # type: dict
+
+        # Maps the key of each response read since the last flush to when it was read
+        self._accessed = {}  # type: dict
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path.join(cache_dir, "responses.sqlite3"), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                 "key TEXT PRIMARY KEY, "
+                                 "source TEXT NOT NULL, "
+                                 "query TEXT NOT NULL, "
+                                 "value TEXT NOT NULL, "
+                                 "size INTEGER NOT NULL, "
+                                 "created REAL NOT NULL, "
+                                 "last_access REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._connection.commit()
+
+        self._size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, source, query):
+        """
+        Looks up a cached response
+
+        :param str source: The name of the source. Ex: mdbg
+        :param str query: The query sent to the source
+        :return: Returns the cached response or None if there isn't a live one
+        :rtype: str
+        """
+
+        with self._lock:
+            value = None
+
+            if not self.refresh:
+                key = make_key(source, query)
+                row = self._connection.execute("SELECT value, created FROM responses WHERE key = ?",
+                                               (key,)).fetchone()
+                now = time.time()
+
+                if row is not None and now - row[1] <= self.ttls.get(source, DEFAULT_TTLS.get(source, 0)):
+                    value = row[0]
+                    self._accessed[key] = now
+                    if len(self._accessed) >= ACCESS_BATCH_SIZE:
+                        self._flush_accesses()
+                        self._connection.commit()
+
+            if value is None:
+                self.misses[source] = self.misses.get(source, 0) + 1
+            else:
+                self.hits[source] = self.hits.get(source, 0) + 1
+
+            return value
+
+    def _flush_accesses(self):
+        """
+        Writes out when the responses read since the last flush were used. The caller holds the lock and commits.
+
+        :return: Returns nothing
+        """
+        if self._accessed:
+            self._connection.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                         [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed = {}
+
+    def put(self, source, query, value):
+        """
+        Stores a response, evicting the least recently used responses if this pushes us over max_size
+
+        :param str source: The name of the source. Ex: mdbg
+        :param str query: The query sent to the source
+        :param str value: The response to store
+        :return: Returns nothing
+        """
+
+        key = make_key(source, query)
+        size = len(value.encode("utf-8"))
+        now = time.time()
+
+        with self._lock:
+            # So that eviction sees which responses were really used last
+            self._flush_accesses()
+
+            old = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._size = self._size - old[0]
+
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     (key, source, normalize_query(query), value, size, now, now))
+            self._size = self._size + size
+
+            while self._size > self.max_size:
+                oldest = self._connection.execute("SELECT key, size FROM responses ORDER BY last_access "
+                                                  "LIMIT 64").fetchall()
+                if not oldest:
+                    break
+                for oldest_key, oldest_size in oldest:
+                    self._connection.execute("DELETE FROM responses WHERE key = ?", (oldest_key,))
+                    self._size = self._size - oldest_size
+                    if self._size <= self.max_size:
+                        break
+
+            self._connection.commit()
+
+    def get_or_fetch(self, source, query, fetch):
+        """
+        Returns the cached response for a query or, if there isn't one, calls fetch and caches what it returns
+
+        :param str source: The name of the source. Ex: mdbg
+        :param str query: The query sent to the source
+        :param fetch: A function taking no arguments which returns the response as a string
+        :return: Returns the response
+        :rtype: str
+        """
+
+        value = self.get(source, query)
+
+        if value is None:
+            value = fetch()
+            self.put(source, query, value)
+
+        return value
+
+    def log_stats(self):
+        """
+        Writes the hit and miss counts for each source to the log
+
+        :return: Returns nothing
+        """
+        for source in sorted(set(self.hits) | set(self.misses)):
+            logging.info("Cache " + source + ": " + str(self.hits.get(source, 0)) + " hits, " +
+                         str(self.misses.get(source, 0)) + " misses.")
+
+    def close(self):
+        """
+        Logs the cache statistics, writes out the outstanding access times and closes the database
+
+        :return: Returns nothing
+        """
+        self.log_stats()
+        with self._lock:
+            self._flush_accesses()
+            self._connection.commit()
+            self._connection.close()
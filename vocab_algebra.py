@@ -0,0 +1,139 @@
+"""
+Set algebra over vocabulary lists. Replaces list_subtractor.py, which could only take hsk_4.txt away from hsk_5.txt.
+
+Each input file has one word per line, optionally followed by a tab and its pinyin and anything else, like the
+新的單詞 exports. Words are compared by their simplified form, so a traditional list and a simplified list line up, and
+with --match pinyin the pinyin has to match too (numbered and tone marked pinyin compare equal). Output keeps the
+order in which words first appear and each word is only written once. Membership is tested against hash sets and the
+first file is streamed, so the run time is linear in the total size of the inputs.
+
+    python vocab_algebra.py difference hsk_5.txt hsk_4.txt --output output.txt
+    python vocab_algebra.py union deck_1.txt deck_2.txt 新的單詞
+    python vocab_algebra.py intersection 新的單詞 previous_deck.txt --match pinyin
+"""
+
+import sys
+from argparse import ArgumentParser
+from itertools import islice
+
+import conversion
+from pinyin import comparison_key
+
+OPERATIONS = ["union", "difference", "intersection"]
+CHUNK_SIZE = 10000
+
+
+def read_entries(file_name, match_pinyin=False):
+    """
+    Streams the entries of a vocabulary list. Lines are read in chunks and each chunk's words are converted to
+    simplified characters in one pass.
+
+    :param str file_name: The path to the list
+    :param bool match_pinyin: Whether the pinyin is part of the key
+    :return: Yields a tuple of (key, line without its newline) for every line that isn't blank. The key is the
+             simplified word or, with match_pinyin, a tuple of the simplified word and its normalized pinyin.
+    """
+    with open(file_name, encoding="utf-8-sig") as vocabulary_file:
+        while True:
+            lines = [line.rstrip("\r\n") for line in islice(vocabulary_file, CHUNK_SIZE)]
+            if not lines:
+                break
+
+            fields = [line.strip().split("\t") for line in lines]
+            words = conversion.bulk_to_simplified([line_fields[0].strip() for line_fields in fields])
+
+            for line, line_fields, word in zip(lines, fields, words):
+                if not word:
+                    continue
+
+                if match_pinyin:
+                    word_pinyin = line_fields[1].strip() if len(line_fields) > 1 else ""
+                    yield (word, comparison_key(word_pinyin)), line
+                else:
+                    yield word, line
+
+
+def read_keys(file_name, match_pinyin=False):
+    """
+    :return: Returns the set of keys in a vocabulary list
+    :rtype: set
+    """
+    return {key for key, _ in read_entries(file_name, match_pinyin)}
+
+
+def union(file_names, match_pinyin=False):
+    """
+    :param list file_names: The lists to combine
+    :param bool match_pinyin: Whether the pinyin is part of the key
+    :return: Yields every line whose key hasn't been seen before, going through the files in order
+    """
+    seen = set()
+    for file_name in file_names:
+        for key, line in read_entries(file_name, match_pinyin):
+            if key not in seen:
+                seen.add(key)
+                yield line
+
+
+def difference(file_names, match_pinyin=False):
+    """
+    :param list file_names: The list to take from followed by the lists to take away
+    :param bool match_pinyin: Whether the pinyin is part of the key
+    :return: Yields the lines of the first list whose key isn't in any of the others
+    """
+    excluded = set()
+    for file_name in file_names[1:]:
+        excluded.update(read_keys(file_name, match_pinyin))
+
+    for key, line in read_entries(file_names[0], match_pinyin):
+        if key not in excluded:
+            excluded.add(key)
+            yield line
+
+
+def intersection(file_names, match_pinyin=False):
+    """
+    :param list file_names: The lists to intersect. Lines come out as they appear in the first.
+    :param bool match_pinyin: Whether the pinyin is part of the key
+    :return: Yields the lines of the first list whose key is in every other list
+    """
+    common = None  # type: set
+    for file_name in file_names[1:]:
+        keys = read_keys(file_name, match_pinyin)
+        common = keys if common is None else common & keys
+
+    seen = set()
+    for key, line in read_entries(file_names[0], match_pinyin):
+        if (common is None or key in common) and key not in seen:
+            seen.add(key)
+            yield line
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Union, difference and intersection of vocabulary lists")
+    parser.add_argument('operation', choices=OPERATIONS,
+                        help='union combines every list. difference keeps what is in the first list and none of the '
+                             'others. intersection keeps what is in the first list and all of the others.')
+    parser.add_argument('files', metavar='FILE', nargs='+',
+                        help='Newline delimited word lists. A tab and the pinyin may follow each word.')
+    parser.add_argument('--match', dest="match", required=False, type=str, default="word", choices=['word', 'pinyin'],
+                        help='word compares the words alone. pinyin compares (word, pinyin) pairs so the same '
+                             'characters with a different reading count as a different entry.')
+    parser.add_argument('--output', metavar='OUTPUT_FILE', dest="output_file_name", required=False, type=str,
+                        default=None, help='Where to write the result. Defaults to standard out.')
+    args = parser.parse_args(argv)
+
+    operation = {"union": union, "difference": difference, "intersection": intersection}[args.operation]
+    lines = operation(args.files, match_pinyin=args.match == "pinyin")
+
+    if args.output_file_name is None:
+        for line in lines:
+            sys.stdout.write(line + "\n")
+    else:
+        with open(args.output_file_name, 'w', encoding="utf-8-sig") as output_file:
+            for line in lines:
+                output_file.write(line + "\n")
+
+
+if __name__ == '__main__':
+    main()